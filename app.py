@@ -1,17 +1,72 @@
 import os
 import base64
-from flask import Flask, request, jsonify, render_template
-from chatbot import enhanced_match_intent, generate_response, initialize_chatbot, load_intents, speak_macos, recognize_speech
+import json
+import random
+import threading
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
+from chatbot import GENERATION_CACHE, INTENT_CACHE, INTENT_STATS, LEARNING_QUEUE, current_intents, enhanced_match_intent, generate_response, initialize_chatbot, load_intents, speak_macos, recognize_speech, stream_response, update_intents, watch_intents_file
 import speech_recognition as sr
 
+from intent_index import SUGGESTION_COUNT, normalize_utterance, topic_name
+from intent_similarity import SIMILARITY_THRESHOLD
+from intent_shards import connect_from_environment
+from intent_watcher import IntentsWatcher
+from generation_scheduler import GenerationScheduler
+from model_loader import WARMUP_PROMPTS, ModelLoader
+from model_pool import ModelPool
+from session_cache import SessionCache
+
 # Initialize Flask app
 app = Flask(__name__)
 
-# Load intents
-intents = load_intents()
+# With MODEL_WORKERS set, fork the pool's template process now, while this
+# is the only thread. It loads DialoGPT itself, so startup does not wait
+# for the model either way
+MODEL_POOL = ModelPool.from_environment(initialize_chatbot)
+
+# Intents sharded across matcher processes when INTENT_SHARDS is set;
+# otherwise load them here and reload them in the background whenever the
+# files change
+SHARDED_INTENTS = connect_from_environment()
+if SHARDED_INTENTS is not None:
+    IntentsWatcher(['intents.json'], lambda changed: SHARDED_INTENTS.reload()).start()
+else:
+    load_intents()
+    threading.Thread(target=watch_intents_file, daemon=True).start()
+
+# Learned intents are journaled against intents.json and compacted into it,
+# so shards compiled from another file (INTENT_SHARDS_SOURCE) would lose
+# them at the next compaction; learning is off for those
+LEARNING_ENABLED = SHARDED_INTENTS is None or SHARDED_INTENTS.source in (None, 'intents.json')
+if not LEARNING_ENABLED:
+    print(f"Intents are sharded from {SHARDED_INTENTS.source}, not intents.json; learning is off.")
+
+# Load the model in the background so the app serves intent matches (and
+# the health checks) while DialoGPT is still loading
+def load_model():
+    """
+    Load DialoGPT and start the micro-batching generation scheduler over it
+    (sized by GENERATION_MAX_BATCH and GENERATION_MAX_WAIT_MS), plus the
+    per-session cache of past keys and values when SESSION_CACHE_MB is set.
+    With MODEL_WORKERS set, wait for the pool's template to load the model
+    and fork the workers instead; the pool then stands in for the pipeline.
+    """
+    if MODEL_POOL is not None:
+        MODEL_POOL.start()
+        return MODEL_POOL, MODEL_POOL.tokenizer, MODEL_POOL, MODEL_POOL.sessions
+    chatbot, tokenizer = initialize_chatbot()
+    return (chatbot, tokenizer, GenerationScheduler.from_environment(chatbot),
+            SessionCache.from_environment(chatbot, generation_cache=GENERATION_CACHE))
+
+MODEL = ModelLoader(
+    load_model,
+    warmup=lambda model: [generate_response(*model[:2], prompt, [], scheduler=model[2])
+                          for prompt in WARMUP_PROMPTS]
+)
+MODEL.start()
 
-# Initialize chatbot
-chatbot, tokenizer = initialize_chatbot()
+# Reply for unmatched messages until the model is ready
+WARMING_UP_RESPONSE = "I'm still warming up. Please ask me that again in a moment."
 
 conversation_history = []
 
@@ -77,13 +132,35 @@ def audio_to_text(audio_data):
         print(f"Error in speech-to-text: {e}")
         return None
 
-@app.route("/chat", methods=["POST"])
-def chat():
+def match_sharded(user_message):
     """
-    Handle chat messages from both text and audio input
+    Scatter-gather intent match across the shards. Like enhanced_match_intent,
+    repeated utterances are answered from INTENT_CACHE, hits and misses are
+    counted in INTENT_STATS, misses are queued for learning and None is
+    returned. The classifier backend and hit reordering only apply to a
+    local index.
     """
-    global conversation_history
+    text_key = normalize_utterance(user_message)
+    resolved = INTENT_CACHE.get(SHARDED_INTENTS, (text_key, SIMILARITY_THRESHOLD))
+    if resolved is None:
+        resolved = SHARDED_INTENTS.resolve(text_key, SIMILARITY_THRESHOLD) or (None, (), 0.0)
+        INTENT_CACHE.put(SHARDED_INTENTS, (text_key, SIMILARITY_THRESHOLD), resolved)
+    
+    tag, responses, _ = resolved
+    if tag is None:
+        INTENT_STATS.record_miss()
+        if LEARNING_ENABLED:
+            LEARNING_QUEUE.submit(user_message)
+        return None
     
+    INTENT_STATS.record_hit(tag)
+    return random.choice(responses)
+
+def read_message():
+    """
+    The user's message from a chat request, transcribing audio input.
+    Returns (message, error reply); the message is None on an error.
+    """
     # Get input type and data
     input_type = request.json.get("input_type", "text")
     input_data = request.json.get("message", "").strip()
@@ -92,28 +169,77 @@ def chat():
     if input_type == "audio":
         user_message = audio_to_text(input_data)
         if not user_message:
-            return jsonify({
-                "response": "Sorry, I couldn't understand the audio.",
-                "audio_response": None
-            })
+            return None, "Sorry, I couldn't understand the audio."
     else:
         # Text input
         user_message = input_data
     
     if not user_message:
+        return None, "I didn't get that. Please try again."
+    return user_message, None
+
+def match_message(user_message):
+    """
+    Reply of the intent matching user_message, or None
+    """
+    if SHARDED_INTENTS is not None:
+        return match_sharded(user_message)
+    # Pin one intents snapshot for the whole request; updates published
+    # meanwhile only affect later requests
+    return enhanced_match_intent(user_message, current_intents())
+
+def warming_up_response(user_message):
+    """
+    Reply for an unmatched message until the model is ready, offering the
+    topics of the nearest intents (merged across the shards when sharded)
+    """
+    text = normalize_utterance(user_message)
+    if SHARDED_INTENTS is not None:
+        tags = [tag for tag, _ in SHARDED_INTENTS.top_k(text, SUGGESTION_COUNT)]
+    else:
+        tags = current_intents().suggest_topics(text)
+    topics = list(dict.fromkeys(topic_name(tag) for tag in tags))
+    if not topics:
+        return WARMING_UP_RESPONSE
+    return f"{WARMING_UP_RESPONSE} Meanwhile, I can talk about {', '.join(topics)}."
+
+@app.route("/chat", methods=["POST"])
+def chat():
+    """
+    Handle chat messages from both text and audio input
+    """
+    global conversation_history
+    
+    session_id = request.json.get("session_id")
+    user_message, error = read_message()
+    if error:
         return jsonify({
-            "response": "I didn't get that. Please try again.",
+            "response": error,
             "audio_response": None
         })
 
     # Check for a matched intent
-    response = enhanced_match_intent(user_message, intents)
+    response = match_message(user_message)
 
-    # If no intent matched, use the transformer model
-    if not response:
-        conversation_history.append(user_message)
-        response = generate_response(chatbot, tokenizer, user_message, conversation_history)
-        conversation_history.append(response)
+    # If no intent matched, use the transformer model once it is ready
+    model = None if response else MODEL.get()
+    if not response and model is None:
+        response = warming_up_response(user_message)
+    elif not response:
+        chatbot, tokenizer, scheduler, sessions = model
+        INTENT_STATS.record_generation()
+        if sessions is not None and session_id:
+            # The session keeps its own history, encoded once
+            response = generate_response(chatbot, tokenizer, user_message, None,
+                                         sessions=sessions, session_id=session_id)
+        else:
+            conversation_history.append(user_message)
+            response = generate_response(chatbot, tokenizer, user_message, conversation_history,
+                                         scheduler=scheduler)
+            conversation_history.append(response)
+        
+        # Keep the generated reply as a suggestion for the reviewer
+        LEARNING_QUEUE.suggest(user_message, response)
 
     # Convert response to audio
     audio_response = text_to_speech(response)
@@ -123,6 +249,54 @@ def chat():
         "audio_response": audio_response
     })
 
+def server_sent_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    Like /chat, but streams the reply as server-sent events: a "token" event
+    for every piece of generated text as it is produced, then a "done" event
+    with the full response and its audio. Intent matches are sent at once.
+    """
+    global conversation_history
+    
+    session_id = request.json.get("session_id")
+    user_message, error = read_message()
+    response = error or match_message(user_message)
+    model = None if response else MODEL.get()
+    if not response and model is None:
+        response = warming_up_response(user_message)
+    
+    def events():
+        reply = response
+        if not reply:
+            chatbot, tokenizer, scheduler, sessions = model
+            INTENT_STATS.record_generation()
+            use_session = sessions is not None and session_id
+            history = None if use_session else conversation_history + [user_message]
+            pieces = []
+            for piece in stream_response(chatbot, tokenizer, user_message, history,
+                                         sessions=sessions if use_session else None,
+                                         session_id=session_id,
+                                         pool=scheduler if isinstance(scheduler, ModelPool) else None):
+                pieces.append(piece)
+                yield server_sent_event("token", {"text": piece})
+            reply = "".join(pieces).strip()
+            if not use_session:
+                conversation_history.extend([user_message, reply])
+            LEARNING_QUEUE.suggest(user_message, reply)
+        else:
+            yield server_sent_event("token", {"text": reply})
+        
+        yield server_sent_event("done", {
+            "response": reply,
+            "audio_response": None if error else text_to_speech(reply)
+        })
+    
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.route("/speech-to-text", methods=["POST"])
 def speech_to_text():
     """
@@ -143,5 +317,89 @@ def speech_to_text():
     except Exception as e:
         return jsonify({"text": f"Error: {str(e)}"})
 
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """
+    Liveness: the process is up and serving requests
+    """
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """
+    Readiness: 200 once the model is loaded and warmed up, 503 before
+    """
+    status = MODEL.status()
+    return jsonify(status), 200 if MODEL.ready() else 503
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    """
+    Intent hit/miss counters, the most hit intents, and cache and learning
+    queue statistics
+    """
+    top = request.args.get("top", default=20, type=int)
+    model = MODEL.get()
+    return jsonify({
+        "intents": INTENT_STATS.snapshot(top),
+        "generation": model[2].stats() if model else None,
+        "sessions": model[3].stats() if model and model[3] is not None else None,
+        "generation_cache": GENERATION_CACHE.stats() if GENERATION_CACHE is not None else None,
+        "version": current_intents().version if SHARDED_INTENTS is None else None,
+        "shards": SHARDED_INTENTS.stats() if SHARDED_INTENTS is not None else None,
+        "cache": INTENT_CACHE.stats(),
+        "learning": LEARNING_QUEUE.stats()
+    })
+
+@app.route("/learning", methods=["GET"])
+def learning_queue():
+    """
+    List unmatched utterances waiting to be taught a response
+    """
+    limit = request.args.get("limit", type=int)
+    return jsonify({
+        "pending": LEARNING_QUEUE.pending(limit),
+        "stats": LEARNING_QUEUE.stats()
+    })
+
+@app.route("/learning/<int:item_id>", methods=["POST"])
+def learn_intent(item_id):
+    """
+    Teach the response for a queued utterance. Without a "response" in the
+    body, the suggested (generated) reply is learned.
+    """
+    if not LEARNING_ENABLED:
+        return jsonify({"error": f"Learning is off while the intents are sharded from {SHARDED_INTENTS.source}"}), 409
+    
+    item = LEARNING_QUEUE.remove(item_id)
+    if item is None:
+        return jsonify({"error": "No such pending utterance"}), 404
+    
+    response = ((request.get_json(silent=True) or {}).get("response") or item['suggestion'] or "").strip()
+    if not response:
+        # Put it back for someone who has a response
+        LEARNING_QUEUE.submit(item['text'])
+        return jsonify({"error": "A response is required"}), 400
+    
+    learned = update_intents(item['text'], response)
+    if learned and SHARDED_INTENTS is not None:
+        SHARDED_INTENTS.reload()
+    
+    return jsonify({
+        "learned": learned,
+        "text": item['text'],
+        "response": response
+    })
+
+@app.route("/learning/<int:item_id>", methods=["DELETE"])
+def dismiss_utterance(item_id):
+    """
+    Drop a queued utterance without learning anything
+    """
+    item = LEARNING_QUEUE.remove(item_id)
+    if item is None:
+        return jsonify({"error": "No such pending utterance"}), 404
+    return jsonify({"dismissed": item['text']})
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
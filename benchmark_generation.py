@@ -0,0 +1,56 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from chatbot3 import initialize_chatbot
+from generation_scheduler import DEFAULT_MAX_WAIT, GenerationScheduler
+
+PROMPTS = [
+    "Hello, how are you?",
+    "What do you like to do on weekends?",
+    "Can you recommend a good book?",
+    "What's the best way to learn a new language?",
+    "Tell me something about the ocean.",
+    "Do you like music?",
+    "What should I cook for dinner tonight?",
+    "How do I stay focused while studying?"
+]
+
+
+def run(generate, concurrency, requests):
+    """
+    Send requests prompts from concurrency threads and return the elapsed seconds.
+    """
+    prompts = [PROMPTS[i % len(PROMPTS)] for i in range(requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(generate, prompts))
+    return time.perf_counter() - start
+
+
+def main():
+    """
+    Compare generation throughput with and without micro-batching as
+    concurrency grows.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--requests', type=int, default=16, help="requests per run")
+    parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT * 1000)
+    args = parser.parse_args()
+
+    chatbot, _ = initialize_chatbot()
+
+    print(f"{'concurrency':>11}{'sequential req/s':>18}{'batched req/s':>15}{'batched tok/s':>15}")
+    for concurrency in args.concurrency:
+        sequential = run(chatbot, concurrency, args.requests)
+        scheduler = GenerationScheduler.from_pipeline(
+            chatbot, max_batch_size=concurrency, max_wait=args.max_wait_ms / 1000
+        )
+        batched = run(scheduler.generate, concurrency, args.requests)
+        print(f"{concurrency:>11}{args.requests / sequential:>18.2f}{args.requests / batched:>15.2f}"
+              f"{scheduler.stats()['tokens_per_second']:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
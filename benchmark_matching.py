@@ -0,0 +1,179 @@
+import argparse
+import json
+import random
+import time
+
+import intent_similarity
+from intent_index import IntentIndex, load_intents_csv
+
+
+def naive_first_match(text, intents):
+    """
+    The original first-pass loop from enhanced_match_intent, returning the
+    position of the matching intent instead of a response.
+    """
+    text_lower = text.lower()
+    for position, intent in enumerate(intents['intents']):
+        for pattern in intent['patterns']:
+            if pattern.lower() in text_lower:
+                return position
+    return None
+
+
+def naive_flexible_match(text, intents):
+    """
+    The original second-pass loop from enhanced_match_intent.
+    """
+    text_lower = text.lower()
+    for position, intent in enumerate(intents['intents']):
+        for pattern in intent['patterns']:
+            if pattern.lower() in text_lower or text_lower in pattern.lower():
+                return position
+    return None
+
+
+def scale_intents(intents, num_tags):
+    """
+    Grow an intents document to num_tags tags by cloning existing intents
+    with a distinguishing suffix on every tag and pattern.
+    """
+    base = intents['intents']
+    scaled = []
+    for i in range(num_tags):
+        intent = base[i % len(base)]
+        copy = i // len(base)
+        suffix = f" v{copy}" if copy else ""
+        scaled.append({
+            "tag": f"{intent['tag']}{suffix.replace(' ', '_')}",
+            "patterns": [f"{pattern}{suffix}" for pattern in intent['patterns']],
+            "responses": intent['responses']
+        })
+    return {"intents": scaled}
+
+
+def sample_utterances(intents, count, seed=0):
+    """
+    Build a mixed workload: patterns embedded in longer sentences plus
+    utterances that match nothing.
+    """
+    rng = random.Random(seed)
+    patterns = [p for intent in intents['intents'] for p in intent['patterns']]
+    utterances = []
+    for i in range(count):
+        if i % 4 == 3:
+            utterances.append("could you recite a poem about the sea for me please")
+        else:
+            utterances.append(f"um so {rng.choice(patterns)} thanks")
+    return utterances
+
+
+def near_miss_utterances(intents, count, seed=0):
+    """
+    Patterns with one character dropped, the way speech recognition tends to
+    garble them, plus utterances that match nothing.
+    """
+    rng = random.Random(seed)
+    patterns = [p for intent in intents['intents'] for p in intent['patterns'] if len(p) > 3]
+    utterances = []
+    for i in range(count):
+        if i % 4 == 3:
+            utterances.append("could you recite a poem about the sea for me please")
+        else:
+            pattern = rng.choice(patterns)
+            cut = rng.randrange(1, len(pattern) - 1)
+            utterances.append(pattern[:cut] + pattern[cut + 1:])
+    return utterances
+
+
+def time_calls(func, utterances, repeat):
+    """
+    Mean seconds per call of func over the workload.
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in utterances:
+            func(text)
+    return (time.perf_counter() - start) / (repeat * len(utterances))
+
+
+def run(corpora, num_utterances, repeat):
+    print(f"{'corpus':<28}{'tags':>7}{'patterns':>10}{'unique':>8}{'build ms':>10}"
+          f"{'loop us':>10}{'automaton us':>14}{'speedup':>9}")
+    for name, intents in corpora:
+        num_patterns = sum(len(intent['patterns']) for intent in intents['intents'])
+
+        start = time.perf_counter()
+        index = IntentIndex.from_document(intents)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        utterances = sample_utterances(intents, num_utterances)
+        for text in utterances:
+            assert index.match(text.lower()) == naive_first_match(text, intents)
+
+        loop = time_calls(lambda text: naive_first_match(text, intents), utterances, repeat)
+        compiled = time_calls(lambda text: index.match(text.lower()), utterances, repeat)
+
+        print(f"{name:<28}{len(intents['intents']):>7}{num_patterns:>10}"
+              f"{len(index.patterns):>8}{build_ms:>10.1f}"
+              f"{loop * 1e6:>10.1f}{compiled * 1e6:>14.1f}{loop / compiled:>8.1f}x")
+
+
+def run_second_pass(corpora, num_utterances, repeat):
+    if not intent_similarity.is_available():
+        print("\nNumPy/SciPy not installed; skipping the similarity pass benchmark.")
+        return
+
+    print(f"\n{'corpus':<28}{'build ms':>10}{'candidates':>12}{'loop us':>10}"
+          f"{'similarity us':>15}{'speedup':>9}")
+    for name, intents in corpora:
+        index = IntentIndex.from_document(intents)
+        start = time.perf_counter()
+        index.similarity
+        build_ms = (time.perf_counter() - start) * 1000
+
+        # The second pass only sees utterances the automaton missed
+        utterances = [
+            text for text in near_miss_utterances(intents, num_utterances)
+            if index.match(text.lower()) is None
+        ] or ["could you recite a poem about the sea for me please"]
+
+        candidates = sum(
+            len(index.tokens.candidates(text.lower())) for text in utterances
+        ) / len(utterances)
+
+        loop = time_calls(lambda text: naive_flexible_match(text, intents), utterances, repeat)
+        vectorized = time_calls(lambda text: index.match_similar(text.lower()), utterances, repeat)
+
+        print(f"{name:<28}{build_ms:>10.1f}{candidates:>12.1f}{loop * 1e6:>10.1f}"
+              f"{vectorized * 1e6:>15.1f}{loop / vectorized:>8.1f}x")
+
+
+def main():
+    """
+    Compare the original nested loops with the compiled automaton and the
+    vectorized similarity pass as the number of tags grows from intents.json
+    to the CSV corpus and beyond.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--json', default='intents.json')
+    parser.add_argument('--csv', default='intents.csv')
+    parser.add_argument('--utterances', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.json, 'r') as file:
+        json_intents = json.load(file)
+    csv_intents = load_intents_csv(args.csv)
+
+    corpora = [
+        (args.json, json_intents),
+        (f"{args.json} x 100 tags", scale_intents(json_intents, 100)),
+        (args.csv, csv_intents),
+        (f"{args.csv} x 5000 tags", scale_intents(csv_intents, 5000)),
+    ]
+    run(corpora, args.utterances, args.repeat)
+    run_second_pass(corpora, args.utterances, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import copy
+import statistics
+import time
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from quantization import model_size, quantize_model
+
+# Fixed prompts, so runs on different nodes compare the same work
+PROMPTS = [
+    "Hello, how are you?",
+    "What do you like to do on weekends?",
+    "Can you recommend a good book?",
+    "What's the best way to learn a new language?",
+    "Tell me something about the ocean.",
+    "Do you like music?",
+    "What should I cook for dinner tonight?",
+    "How do I stay focused while studying?",
+    "What is your favorite movie?",
+    "I had a really long day at work.",
+    "Do you think it will rain tomorrow?",
+    "Can you tell me a joke?"
+]
+
+
+def generate(model, tokenizer, prompts, max_new_tokens):
+    """
+    Greedy replies to prompts, one at a time as the chatbot generates them.
+
+    Returns:
+        (reply token ids per prompt, seconds per prompt, seconds per token)
+    """
+    replies = []
+    latencies = []
+    tokens = 0
+    for prompt in prompts:
+        input_ids = torch.tensor([tokenizer.encode(prompt) + [tokenizer.eos_token_id]])
+        start = time.perf_counter()
+        with torch.no_grad():
+            outputs = model.generate(
+                input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                max_new_tokens=max_new_tokens,
+                pad_token_id=tokenizer.eos_token_id,
+                do_sample=False
+            )
+        latencies.append(time.perf_counter() - start)
+        reply = outputs[0, input_ids.shape[1]:].tolist()
+        tokens += len(reply)
+        replies.append(reply)
+    return replies, latencies, sum(latencies) / max(tokens, 1)
+
+
+def agreement(reference, replies):
+    """
+    (share of identical replies, mean share of reference tokens matched
+    before the first difference)
+    """
+    identical = sum(a == b for a, b in zip(reference, replies))
+    prefixes = []
+    for a, b in zip(reference, replies):
+        common = 0
+        for x, y in zip(a, b):
+            if x != y:
+                break
+            common += 1
+        prefixes.append(common / max(len(a), 1))
+    return identical / len(reference), statistics.mean(prefixes)
+
+
+def main():
+    """
+    Compare latency, model size and reply agreement of the fp32 model with
+    its dynamically int8-quantized version on a fixed prompt set.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--model', default='microsoft/DialoGPT-medium',
+                        help="model name or path, e.g. results/final_model")
+    parser.add_argument('--max-new-tokens', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=3, help="timed passes over the prompts")
+    parser.add_argument('--threads', type=int, default=None, help="torch intra-op threads")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    fp32 = AutoModelForCausalLM.from_pretrained(args.model).eval()
+    int8 = quantize_model(copy.deepcopy(fp32), 'int8')
+
+    results = {}
+    for name, model in (('fp32', fp32), ('int8', int8)):
+        # One untimed pass so both models are measured warm
+        generate(model, tokenizer, PROMPTS[:1], args.max_new_tokens)
+        latencies = []
+        token_latencies = []
+        for _ in range(args.repeat):
+            replies, prompt_latencies, token_latency = generate(model, tokenizer, PROMPTS, args.max_new_tokens)
+            latencies.extend(prompt_latencies)
+            token_latencies.append(token_latency)
+        results[name] = (replies, latencies, statistics.median(token_latencies), model_size(model))
+
+    reference = results['fp32'][0]
+    print(f"{'model':<6}{'size MB':>10}{'median ms/reply':>17}{'p95 ms/reply':>14}{'ms/token':>10}"
+          f"{'identical':>11}{'prefix':>8}")
+    for name, (replies, latencies, token_latency, size) in results.items():
+        identical, prefix = agreement(reference, replies)
+        p95 = sorted(latencies)[int(0.95 * (len(latencies) - 1))]
+        print(f"{name:<6}{size / 2 ** 20:>10.1f}{statistics.median(latencies) * 1000:>17.1f}"
+              f"{p95 * 1000:>14.1f}{token_latency * 1000:>10.2f}{identical:>11.0%}{prefix:>8.0%}")
+
+    for prompt, a, b in zip(PROMPTS, reference, results['int8'][0]):
+        if a != b:
+            print(f"\n{prompt}\n  fp32: {tokenizer.decode(a, skip_special_tokens=True)}"
+                  f"\n  int8: {tokenizer.decode(b, skip_special_tokens=True)}")
+
+
+if __name__ == "__main__":
+    main()
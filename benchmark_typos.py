@@ -0,0 +1,94 @@
+import argparse
+import random
+import string
+import time
+
+from evaluate_intents import load_replay
+from fuzzy_index import MIN_TOKEN_LENGTH, WORD_PATTERN
+from intent_index import IntentIndex, load_intent_document, normalize_utterance
+from intent_similarity import SIMILARITY_THRESHOLD
+
+
+def inject_typo(text, rng):
+    """
+    Apply one random deletion, insertion, substitution or transposition to
+    one word of text, the kind of error speech recognition makes.
+    """
+    words = [match for match in WORD_PATTERN.finditer(text) if len(match.group()) >= MIN_TOKEN_LENGTH]
+    if not words:
+        return text
+    match = rng.choice(words)
+    word = match.group()
+    i = rng.randrange(len(word))
+    edit = rng.choice(('delete', 'insert', 'substitute', 'transpose'))
+    if edit == 'delete':
+        word = word[:i] + word[i + 1:]
+    elif edit == 'insert':
+        word = word[:i] + rng.choice(string.ascii_lowercase) + word[i:]
+    elif edit == 'substitute':
+        word = word[:i] + rng.choice(string.ascii_lowercase.replace(word[i], '')) + word[i + 1:]
+    elif i + 1 < len(word):
+        word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return text[:match.start()] + word + text[match.end():]
+
+
+def replay(index, utterances, threshold, fuzzy):
+    """
+    Resolve every utterance and return (positions, seconds per utterance).
+    """
+    start = time.perf_counter()
+    positions = [index.resolve(text, threshold, fuzzy=fuzzy)[0] for text in utterances]
+    return positions, (time.perf_counter() - start) / max(len(utterances), 1)
+
+
+def main():
+    """
+    Replay intents.csv with injected typos against intents.json and count
+    how many generation calls the spelling correction pass avoids.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    # With one typo, the similarity pass alone still matches every CSV
+    # pattern against its own intents, leaving spelling nothing to recover
+    parser.add_argument('--intents', default='intents.json',
+                        help="intents to match against (.json or .csv)")
+    parser.add_argument('--replay', default='intents.csv',
+                        help="utterances to replay (.csv with pattern/tag columns, or one per line)")
+    parser.add_argument('--threshold', type=float, default=SIMILARITY_THRESHOLD)
+    parser.add_argument('--typos', type=int, default=2, help="typos injected per utterance")
+    parser.add_argument('--limit', type=int, default=5000, help="utterances to replay")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    index = IntentIndex.from_document(load_intent_document(args.intents))
+    rng = random.Random(args.seed)
+    clean = [normalize_utterance(text) for text, _ in load_replay(args.replay)]
+    rng.shuffle(clean)
+    clean = clean[:args.limit]
+    noisy = []
+    for text in clean:
+        for _ in range(args.typos):
+            text = inject_typo(text, rng)
+        noisy.append(text)
+
+    expected, _ = replay(index, clean, args.threshold, fuzzy=False)
+    index.spelling  # build before timing
+    results = {}
+    for fuzzy in (False, True):
+        results[fuzzy] = replay(index, noisy, args.threshold, fuzzy)
+
+    print(f"Utterances: {len(noisy)} with {args.typos} typo(s) each, "
+          f"{len(index.spelling)} words in the spelling index")
+    print(f"{'matcher':<22}{'generation calls':>18}{'same intent':>14}{'us/utterance':>15}")
+    for fuzzy, label in ((False, "exact + similarity"), (True, "+ spelling correction")):
+        positions, seconds = results[fuzzy]
+        misses = sum(position is None for position in positions)
+        agree = sum(position == want for position, want in zip(positions, expected))
+        print(f"{label:<22}{misses:>18}{agree / len(noisy):>14.1%}{seconds * 1e6:>15.1f}")
+
+    avoided = sum(position is None for position in results[False][0]) - \
+        sum(position is None for position in results[True][0])
+    print(f"Generation calls avoided: {avoided}")
+
+
+if __name__ == "__main__":
+    main()
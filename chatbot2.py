@@ -2,9 +2,14 @@ import os
 import sys
 import subprocess
 import speech_recognition as sr
-import random
 import json
 
+from chatbot3 import topic_suggestions
+from intent_classifier import classify_intent, load_backend
+from intent_index import IntentIndex, get_intent_index
+from intent_similarity import SIMILARITY_THRESHOLD
+from intent_store import load_intent_index
+
 # Transformer Model Import
 try:
     from transformers import pipeline, AutoModelForCausalLM, AutoTokenizer
@@ -15,6 +20,9 @@ except ImportError:
 # Initialize the speech recognition engine
 recognizer = sr.Recognizer()
 
+# Trained classifier when INTENT_BACKEND=classifier, otherwise None
+INTENT_CLASSIFIER = load_backend()
+
 def speak_macos(text):
     """
     Text-to-speech for macOS using system 'say' command.
@@ -64,42 +72,29 @@ def load_intents():
     try:
         with open('intents.json', 'r') as file:
             intents = json.load(file)
-        return intents
+        return IntentIndex.from_document(intents)
     except Exception as e:
         print(f"Error loading intents: {e}")
         sys.exit(1)
 
-def match_intent(text, intents):
+def match_intent(text, intents, similarity_threshold=SIMILARITY_THRESHOLD):
     """
     Enhanced intent matching with fuzzy matching and topic suggestions.
     Uses case-insensitive partial matching and provides suggestions.
     """
-    # Convert text to lowercase for case-insensitive matching
-    text_lower = text.lower()
-    
-    # First, try exact pattern matching
-    for intent in intents['intents']:
-        for pattern in intent['patterns']:
-            if pattern.lower() in text_lower:
-                return random.choice(intent['responses'])
-    
-    # If no match found, try more flexible pattern matching
-    for intent in intents['intents']:
-        for pattern in intent['patterns']:
-            if pattern.lower() in text_lower or text_lower in pattern.lower():
-                return random.choice(intent['responses'])
+    index = get_intent_index(intents)
     
-    # If still no match, provide topic suggestions
-    available_topics = [
-        intent['tag'] for intent in intents['intents'] 
-        if 'tag' in intent and intent['tag']
-    ]
+    # Try exact pattern matching first, then fall back to the most similar
+    # pattern, which also catches near-misses from speech recognition
+    if INTENT_CLASSIFIER is not None:
+        position, _ = classify_intent(index, INTENT_CLASSIFIER, text.lower())
+    else:
+        position, _ = index.resolve(text.lower(), similarity_threshold)
+    if position is not None:
+        return index.choose_response(position)
     
-    suggestions = "I didn't understand that. Would you like to talk about: " + \
-                  ", ".join(available_topics) + "? " + \
-                  "Try saying something related to these topics."
-    
-    return suggestions
+    # If still no match, suggest the few topics nearest to what was said
+    return topic_suggestions(text, index)
 def load_intents(default_intents=None):
     """
     Load intents from intents.json file with a fallback to default intents.
@@ -125,12 +120,10 @@ def load_intents(default_intents=None):
     }
     
     try:
-        with open('intents.json', 'r') as file:
-            intents = json.load(file)
-        return intents
+        return load_intent_index()
     except Exception as e:
         print(f"Error loading intents: {e}. Using default intents.")
-        return default_intents
+        return IntentIndex.from_document(default_intents)
     
 def initialize_chatbot():
     """
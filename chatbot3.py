@@ -2,19 +2,54 @@ import os
 import sys
 import subprocess
 import speech_recognition as sr
-import random
 import json
+import threading
+
+from context_builder import get_context_builder
+from generation_cache import GenerationCache, generation_key, model_params
+from intent_cache import IntentCache
+from intent_classifier import classify_intent, load_backend
+from intent_index import IntentIndex, get_intent_index, match_batch, normalize_utterance, topic_name
+from intent_journal import open_journal, replay as replay_journal
+from intent_similarity import SIMILARITY_THRESHOLD
+from intent_stats import IntentStats
+from intent_store import load_intent_index
+from learning_queue import LearningQueue
+from model_pool import ModelPool
 
 # Transformer Model Import
 try:
-    from transformers import pipeline, AutoModelForCausalLM, AutoTokenizer
+    import torch
+    from transformers import pipeline, AutoModelForCausalLM, AutoTokenizer, TextIteratorStreamer
 except ImportError:
     print("Please install transformers: pip install transformers")
     sys.exit(1)
 
+from onnx_export import backend_from_environment, load_onnx_model, onnx_model_path
+from quantization import quantization_from_environment, quantize_model
+
 # Initialize the speech recognition engine
 recognizer = sr.Recognizer()
 
+# Resolved intents for recently seen utterances
+INTENT_CACHE = IntentCache()
+
+# Trained classifier when INTENT_BACKEND=classifier, otherwise None
+INTENT_CLASSIFIER = load_backend()
+
+# Hit, miss and generation-fallback counters
+INTENT_STATS = IntentStats()
+
+# Unmatched utterances waiting to be taught a response
+LEARNING_QUEUE = LearningQueue()
+
+# Replies to recently seen prompts, shared with other processes when
+# GENERATION_CACHE_PATH is set
+GENERATION_CACHE = GenerationCache.from_environment()
+
+# Longest prompt plus reply, in tokens
+MAX_LENGTH = 200
+
 def speak_macos(text):
     """
     Text-to-speech for macOS using system 'say' command.
@@ -29,56 +64,37 @@ def speak_macos(text):
             print(f"TTS Error: {e}")
             print(f"[Would have spoken]: {text}")
 
+def guess_tag(text):
+    """
+    Guess the most appropriate tag for a learned utterance from its keywords.
+    """
+    keywords = {
+        "help": ["help", "assist", "support", "problem"],
+        "greeting": ["hi", "hello", "hey", "greetings"],
+        "goodbye": ["bye", "goodbye", "farewell"],
+        "question": ["what", "how", "why", "when", "where"]
+    }
+    
+    for tag, tag_keywords in keywords.items():
+        if any(keyword in text.lower() for keyword in tag_keywords):
+            return tag
+    return "unknown_intent"
+
 def update_intents(text, response):
     """
-    Update the intents.json file with a new pattern and response.
+    Record a new pattern and response in the intents journal. The journal is
+    folded into intents.json once it grows past COMPACT_THRESHOLD entries.
     """
     try:
-        # Load existing intents
-        with open('intents.json', 'r') as file:
-            intents = json.load(file)
-        
-        # Determine the most appropriate tag
-        tag = "unknown_intent"
-        
-        # Try to guess a tag based on keywords
-        keywords = {
-            "help": ["help", "assist", "support", "problem"],
-            "greeting": ["hi", "hello", "hey", "greetings"],
-            "goodbye": ["bye", "goodbye", "farewell"],
-            "question": ["what", "how", "why", "when", "where"]
-        }
+        # Append instead of rewriting the whole file
+        journal = open_journal()
+        journal.append(guess_tag(text), text, response)
         
-        for suggested_tag, tag_keywords in keywords.items():
-            if any(keyword in text.lower() for keyword in tag_keywords):
-                tag = suggested_tag
-                break
-        
-        # Check if this tag already exists in intents
-        tag_exists = False
-        for intent in intents['intents']:
-            if intent['tag'] == tag:
-                # Add the new pattern if it doesn't already exist
-                if text not in intent['patterns']:
-                    intent['patterns'].append(text)
-                # Add the new response if it doesn't already exist
-                if response not in intent['responses']:
-                    intent['responses'].append(response)
-                tag_exists = True
-                break
-        
-        # If tag doesn't exist, create a new intent
-        if not tag_exists:
-            new_intent = {
-                "tag": tag,
-                "patterns": [text],
-                "responses": [response]
-            }
-            intents['intents'].append(new_intent)
-        
-        # Save the updated intents
-        with open('intents.json', 'w') as file:
-            json.dump(intents, file, indent=4)
+        if journal.needs_compaction():
+            try:
+                journal.compact()
+            except Exception as e:
+                print(f"Error compacting intents journal: {e}")
         
         return True
     except Exception as e:
@@ -138,36 +154,76 @@ def load_intents(default_intents=None):
     }
     
     try:
-        with open('intents.json', 'r') as file:
-            intents = json.load(file)
-        return intents
+        # Apply intents learned since the last compaction
+        return replay_journal(load_intent_index())
     except Exception as e:
         print(f"Error loading intents: {e}. Using default intents.")
-        return default_intents
+        return IntentIndex.from_document(default_intents)
+
+def enhanced_match_intent(text, intents, similarity_threshold=SIMILARITY_THRESHOLD):
+    """
+    Enhanced intent matching: exact patterns first, then the most similar
+    pattern. Never speaks or listens, so its cost is bounded by the lookup;
+    unmatched utterances are queued on LEARNING_QUEUE to be taught later and
+    None is returned so the caller can fall back to the model.
+    """
+    index = get_intent_index(intents)
+    text_key = normalize_utterance(text)
+    
+    # Try exact pattern matching first, then fall back to the most similar
+    # pattern, which also catches near-misses from speech recognition.
+    # Repeated utterances are answered from the cache.
+    resolved = INTENT_CACHE.get(index, (text_key, similarity_threshold))
+    if resolved is None:
+        if INTENT_CLASSIFIER is not None:
+            resolved = classify_intent(index, INTENT_CLASSIFIER, text_key)
+        else:
+            resolved = index.resolve(text_key, similarity_threshold)
+        INTENT_CACHE.put(index, (text_key, similarity_threshold), resolved)
+    
+    # Periodically move the most hit intents to the front of the scans
+    if INTENT_STATS.reorder_due():
+        index.reorder(INTENT_STATS.hit_counts())
+    
+    position, _ = resolved
+    if position is not None:
+        INTENT_STATS.record_hit(index.tags[position])
+        return index.choose_response(position)
+    
+    INTENT_STATS.record_miss()
+    LEARNING_QUEUE.submit(text)
+    return None
 
-def enhanced_match_intent(text, intents):
+def topic_suggestions(text, intents):
+    """
+    Fallback reply offering the few topics nearest to text.
     """
-    Enhanced intent matching with dynamic learning and suggestion mechanism.
-    Uses voice input for learning new intents.
+    index = get_intent_index(intents)
+    topics = [topic_name(tag) for tag in index.suggest_topics(normalize_utterance(text))]
+    if not topics:
+        return "I didn't understand that. Could you rephrase it?"
+    if len(topics) > 1:
+        topics = [", ".join(topics[:-1]), topics[-1]]
+    
+    return "I didn't understand that. Would you like to talk about " + \
+           " or ".join(topics) + "?"
+
+def learn_from_voice(text, intents, save=None):
     """
-    # Convert text to lowercase for case-insensitive matching
-    text_lower = text.lower()
+    Ask the user by voice how to reply to text and save the answer.
     
-    # First, try exact pattern matching
-    for intent in intents['intents']:
-        for pattern in intent['patterns']:
-            if pattern.lower() in text_lower:
-                return random.choice(intent['responses'])
+    Args:
+        text: Unmatched utterance to learn a response for
+        intents: Intents used for the fallback suggestions
+        save: Callable(text, response) storing the new intent; defaults to update_intents
     
-    # If no match found, try more flexible pattern matching
-    for intent in intents['intents']:
-        for pattern in intent['patterns']:
-            if pattern.lower() in text_lower or text_lower in pattern.lower():
-                return random.choice(intent['responses'])
+    Returns:
+        The learned response, or None if nothing was learned
+    """
+    save = save or update_intents
     
-    # If still no match, prompt the user and learn via voice
-    speak_macos("I'm not sure how to respond to that. Could you tell me how I should reply?")
-    print("Bot: I'm not sure how to respond to that. Could you tell me how I should reply?")
+    speak_macos(f"Earlier I wasn't sure how to respond to: {text}. Could you tell me how I should reply?")
+    print(f"Bot: Earlier I wasn't sure how to respond to: {text}. Could you tell me how I should reply?")
     
     # Get user's suggested response via speech recognition
     try:
@@ -187,72 +243,199 @@ def enhanced_match_intent(text, intents):
             
             if confirmation and any(conf in confirmation.lower() for conf in ['yes', 'yeah', 'yep', 'sure', 'okay', 'ok']):
                 # Update intents with new pattern and response
-                update_intents(text, user_response)
+                save(text, user_response)
                 speak_macos(f"Thank you! I'll remember to respond like this when someone says: {text}")
                 print(f"Bot: Thank you! I'll remember to respond like this when someone says: {text}")
                 return user_response
             else:
-                speak_macos("Okay, let's try again. How would you like me to respond?")
-                print("Bot: Okay, let's try again. How would you like me to respond?")
+                speak_macos("Okay, we can try again another time.")
+                print("Bot: Okay, we can try again another time.")
                 return None
         else:
-            speak_macos("Sorry, I couldn't understand your response. Can you try again?")
-            print("Bot: Sorry, I couldn't understand your response. Can you try again?")
+            speak_macos("Sorry, I couldn't understand your response.")
+            print("Bot: Sorry, I couldn't understand your response.")
     except Exception as e:
         print(f"Error in learning new intent: {e}")
         speak_macos("Sorry, there was an error processing your response.")
     
-    # Fallback response with available topics
-    available_topics = [
-        intent['tag'] for intent in intents['intents'] 
-        if 'tag' in intent and intent['tag']
-    ]
-    
-    suggestions = "I didn't understand that. Would you like to talk about: " + \
-                  ", ".join(available_topics) + "? " + \
-                  "Try saying something related to these topics."
+    suggestions = topic_suggestions(text, intents)
+    print(f"Bot: {suggestions}")
+    speak_macos(suggestions)
+    return None
+
+def review_learning_queue(intents, save=None):
+    """
+    Drain LEARNING_QUEUE by voice, one unmatched utterance at a time.
+    Called by the CLI between turns, after the reply has been spoken.
     
-    return suggestions
+    Returns:
+        int: Number of intents learned
+    """
+    learned = 0
+    while True:
+        item = LEARNING_QUEUE.take()
+        if item is None:
+            return learned
+        if learn_from_voice(item['text'], intents, save):
+            learned += 1
 
-def initialize_chatbot():
+def batch_match_intent(utterances, intents, similarity_threshold=SIMILARITY_THRESHOLD, workers=None):
+    """
+    Match many utterances at once, e.g. to replay intents.csv or recorded traffic.
+    Unlike enhanced_match_intent this never speaks or listens; it returns a
+    (tag, score) pair per utterance, with tag None where nothing matched.
+    """
+    return match_batch(utterances, intents, similarity_threshold, workers=workers)
+
+def initialize_chatbot(quantization=None, backend=None):
     """
     Initialize the language model with error handling and parallelism disabled.
+    
+    Args:
+        quantization: 'int8' to dynamically quantize the linear layers for
+            CPU inference; defaults to MODEL_QUANTIZATION, otherwise fp32
+        backend: 'onnx' to generate with ONNX Runtime from the model
+            exported to ONNX_MODEL_PATH; defaults to GENERATION_BACKEND,
+            otherwise 'torch'
     """
     try:
         os.environ["TOKENIZERS_PARALLELISM"] = "false"
         model_name = "microsoft/DialoGPT-medium"
-        tokenizer = AutoTokenizer.from_pretrained(model_name)
-        model = AutoModelForCausalLM.from_pretrained(model_name)
+        backend = backend or backend_from_environment()
+        if backend == 'onnx':
+            model_name = onnx_model_path()
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            model = load_onnx_model(model_name)
+        else:
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            model = AutoModelForCausalLM.from_pretrained(model_name)
+            quantization = quantization or quantization_from_environment()
+            if quantization:
+                model = quantize_model(model, quantization)
         chatbot = pipeline('text-generation', 
                            model=model, 
                            tokenizer=tokenizer,
-                           max_length=200,
+                           max_length=MAX_LENGTH,
                            num_return_sequences=1)
         return chatbot, tokenizer
     except Exception as e:
         print(f"Error initializing chatbot: {e}")
         sys.exit(1)
 
-def generate_response(chatbot, tokenizer, text, conversation_history):
+def response_cache_key(chatbot, prompt):
+    """
+    GENERATION_CACHE key of the reply to prompt token ids, or None when
+    caching is off. chatbot may be a ModelPool, whose model is loaded in
+    its own processes.
+    """
+    if GENERATION_CACHE is None:
+        return None
+    params = chatbot.model_params if isinstance(chatbot, ModelPool) else model_params(chatbot.model)
+    return generation_key(prompt, max_length=MAX_LENGTH, **params)
+
+def generate_response(chatbot, tokenizer, text, conversation_history, scheduler=None,
+                      sessions=None, session_id=None):
     """
     Generate a conversational response using the language model.
+    With a GenerationScheduler, the prompt is batched with those of
+    concurrent requests. With a SessionCache and a session_id, the
+    session's cached history is reused and only the new turn is encoded.
+    Otherwise the prompt holds the most recent turns that fit the
+    ContextBuilder's token budget, and replies to a prompt seen before
+    come from GENERATION_CACHE.
     """
     try:
-        context = " ".join(conversation_history[-3:])
-        full_prompt = f"{context} {text}"
-        responses = chatbot(full_prompt)
+        if sessions is not None and session_id is not None:
+            return sessions.generate(session_id, text) or "I'm not sure how to respond to that."
+        prompt = get_context_builder(tokenizer).build(conversation_history, text)
+        key = response_cache_key(chatbot, prompt)
+        if key is not None:
+            response = GENERATION_CACHE.get(key)
+            if response:
+                return response
         
-        if responses and len(responses) > 0:
-            response = responses[0]['generated_text']
-            if full_prompt in response:
-                response = response.replace(full_prompt, '').strip()
-            return response
+        if scheduler is not None:
+            response = scheduler.generate(prompt)
+        else:
+            input_ids = torch.tensor([prompt])
+            with torch.no_grad():
+                outputs = chatbot.model.generate(
+                    input_ids,
+                    attention_mask=torch.ones_like(input_ids),
+                    max_new_tokens=MAX_LENGTH - len(prompt),
+                    pad_token_id=tokenizer.eos_token_id
+                )
+            response = tokenizer.decode(outputs[0, len(prompt):], skip_special_tokens=True).strip()
         
-        return "I'm not sure how to respond to that."
+        if not response:
+            return "I'm not sure how to respond to that."
+        if key is not None:
+            GENERATION_CACHE.put(key, response)
+        return response
     except Exception as e:
         print(f"Error generating response: {e}")
         return "I'm having trouble understanding right now."
 
+def stream_response(chatbot, tokenizer, text, conversation_history, sessions=None, session_id=None,
+                    pool=None):
+    """
+    Generate a response like generate_response(), yielding its text piece by
+    piece as the tokens are produced. Streamed generations run on their own,
+    outside the GenerationScheduler's batches; a cached reply is yielded
+    whole. With a ModelPool, the generation runs on a worker, which sends
+    the text back as it is produced.
+    """
+    use_session = sessions is not None and session_id is not None
+    key = None
+    if not use_session:
+        prompt = get_context_builder(tokenizer).build(conversation_history, text)
+        key = response_cache_key(chatbot, prompt)
+        if key is not None:
+            response = GENERATION_CACHE.get(key)
+            if response:
+                yield response
+                return
+    
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    errors = []
+    
+    def run():
+        try:
+            if use_session:
+                sessions.generate(session_id, text, streamer=streamer)
+                return
+            if pool is not None:
+                pool.stream(prompt, MAX_LENGTH - len(prompt), streamer)
+                return
+            input_ids = torch.tensor([prompt])
+            with torch.no_grad():
+                chatbot.model.generate(
+                    input_ids,
+                    attention_mask=torch.ones_like(input_ids),
+                    max_new_tokens=MAX_LENGTH - len(prompt),
+                    pad_token_id=tokenizer.eos_token_id,
+                    streamer=streamer
+                )
+        except Exception as e:
+            print(f"Error generating response: {e}")
+            errors.append(e)
+            # Wake up the consumer, which would otherwise wait forever
+            streamer.end()
+    
+    threading.Thread(target=run, name="stream-generation", daemon=True).start()
+    pieces = []
+    for piece in streamer:
+        if piece:
+            pieces.append(piece)
+            yield piece
+    response = "".join(pieces).strip()
+    if errors:
+        yield "I'm having trouble understanding right now."
+    elif not response:
+        yield "I'm not sure how to respond to that."
+    elif key is not None:
+        GENERATION_CACHE.put(key, response)
+
 def chat():
     """
     Main chat loop with voice interaction.
@@ -286,6 +469,7 @@ def chat():
         
         if not response:
             # If no match found, use the transformer model for generating a response
+            INTENT_STATS.record_generation()
             conversation_history.append(text)
             response = generate_response(chatbot, tokenizer, text, conversation_history)
         
@@ -295,6 +479,16 @@ def chat():
         # Print and speak the response
         print(f"Bot: {response}")
         speak_macos(response)
+        
+        # Offer to learn the utterances we could not match, now that the
+        # reply is out; each one is applied to the index in place instead
+        # of recompiling the corpus
+        def save(text, response):
+            nonlocal intents
+            if update_intents(text, response):
+                intents = intents.with_learned(guess_tag(text), text, response)
+        
+        review_learning_queue(intents, save)
 
 def check_dependencies():
     """
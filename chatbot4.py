@@ -13,7 +13,11 @@ import speech_recognition as sr
 import random
 import json
 
-from chatbot3 import enhanced_match_intent, generate_response, initialize_chatbot, recognize_speech, speak_macos
+from chatbot3 import INTENT_STATS, enhanced_match_intent, generate_response, initialize_chatbot, recognize_speech, review_learning_queue, speak_macos
+from intent_index import IntentIndex
+from intent_journal import open_journal, replay as replay_journal
+from intent_store import load_intent_index
+from intent_watcher import IntentsWatcher
 # Transformer Model Import
 try:
     from transformers import pipeline, AutoModelForCausalLM, AutoTokenizer
@@ -21,15 +25,40 @@ except ImportError:
     print("Please install transformers: pip install transformers")
     sys.exit(1)
 
-# Global variables for thread-safe intent management
+# Global variables for thread-safe intent management. Readers use
+# current_intents() without locking; INTENTS_LOCK only serializes writers,
+# which publish a fully built index with a single reference swap.
 INTENTS_LOCK = threading.Lock()
 GLOBAL_INTENTS = None
 
+def read_intents():
+    """
+    Compile the intents on disk, without the journal and without any lock.
+    """
+    return load_intent_index()
+
+def publish_intents(intents):
+    """
+    Apply the journal to a freshly compiled index and make it current.
+    """
+    global GLOBAL_INTENTS
+    with INTENTS_LOCK:
+        # Apply intents learned since the last compaction
+        intents = replay_journal(intents)
+        GLOBAL_INTENTS = intents
+    return intents
+
+def current_intents():
+    """
+    The published intent index. Lock-free: the index is immutable and
+    replaced as a whole, so readers never see a half-built one.
+    """
+    return GLOBAL_INTENTS if GLOBAL_INTENTS is not None else load_intents()
+
 def load_intents(default_intents=None):
     """
     Thread-safe function to load intents from intents.json file.
     """
-    global GLOBAL_INTENTS
     default_intents = default_intents or {
         "intents": [
             {
@@ -42,48 +71,37 @@ def load_intents(default_intents=None):
     }
     
     try:
-        with INTENTS_LOCK:
-            with open('intents.json', 'r') as file:
-                intents = json.load(file)
-                GLOBAL_INTENTS = intents
-                return intents
+        return publish_intents(read_intents())
     except Exception as e:
         print(f"Error loading intents: {e}. Using default intents.")
-        with INTENTS_LOCK:
-            GLOBAL_INTENTS = default_intents
-        return default_intents
+        return publish_intents(IntentIndex.from_document(default_intents))
 
 def watch_intents_file():
     """
-    Background thread to monitor intents.json for changes.
+    Background thread that rebuilds the intent index whenever intents.json
+    or the compiled intents.bin changes (inotify, or polling where that is
+    unavailable). The rebuild happens on this thread; requests keep reading
+    the previous index until the new one is swapped in.
     """
-    global GLOBAL_INTENTS
-    last_modified = 0
-    
-    while True:
+    def reload(changed):
         try:
-            current_modified = os.path.getmtime('intents.json')
-            if current_modified != last_modified:
-                with INTENTS_LOCK:
-                    with open('intents.json', 'r') as file:
-                        GLOBAL_INTENTS = json.load(file)
-                    print("Intents file updated successfully!")
-                last_modified = current_modified
+            intents = read_intents()
         except Exception as e:
+            # Keep serving the current index, e.g. while a file is half-edited
             print(f"Error watching intents file: {e}")
-        
-        time.sleep(1)  # Check every second
+            return
+        publish_intents(intents)
+        print("Intents file updated successfully!")
+    
+    IntentsWatcher(['intents.json', 'intents.bin'], reload).run()
 
 def update_intents(text, response):
     """
-    Enhanced update_intents with real-time file modification.
+    Record a learned intent in the append-only journal and apply it to the
+    in-memory index, instead of rewriting intents.json for every entry.
     """
     global GLOBAL_INTENTS
     try:
-        # Load current intents with lock
-        with INTENTS_LOCK:
-            intents = GLOBAL_INTENTS.copy() if GLOBAL_INTENTS else load_intents()
-        
         # Determine the most appropriate tag
         tag = "unknown_intent"
         keywords = {
@@ -98,33 +116,22 @@ def update_intents(text, response):
                 tag = suggested_tag
                 break
         
-        # Check if this tag already exists in intents
-        tag_exists = False
-        for intent in intents['intents']:
-            if intent['tag'] == tag:
-                # Add the new pattern if it doesn't already exist
-                if text not in intent['patterns']:
-                    intent['patterns'].append(text)
-                # Add the new response if it doesn't already exist
-                if response not in intent['responses']:
-                    intent['responses'].append(response)
-                tag_exists = True
-                break
-        
-        # If tag doesn't exist, create a new intent
-        if not tag_exists:
-            new_intent = {
-                "tag": tag,
-                "patterns": [text],
-                "responses": [response]
-            }
-            intents['intents'].append(new_intent)
+        current_intents()
         
-        # Save the updated intents with lock
+        journal = open_journal()
         with INTENTS_LOCK:
-            with open('intents.json', 'w') as file:
-                json.dump(intents, file, indent=4)
-            GLOBAL_INTENTS = intents
+            # Appending costs the same whatever the size of intents.json
+            journal.append(tag, text, response)
+            GLOBAL_INTENTS = GLOBAL_INTENTS.with_learned(tag, text, response)
+            
+            # Periodically fold the journal into intents.json. The current
+            # index already has every entry; the watcher recompiles the
+            # rewritten file in the background.
+            if journal.needs_compaction():
+                try:
+                    journal.compact()
+                except Exception as e:
+                    print(f"Error compacting intents journal: {e}")
         
         return True
     except Exception as e:
@@ -135,7 +142,7 @@ def chat():
     Main chat loop with voice interaction.
     """
     # Load intents from the file
-    intents = load_intents()
+    load_intents()
     
     # Initialize chatbot
     chatbot, tokenizer = initialize_chatbot()
@@ -158,11 +165,15 @@ def chat():
             speak_macos("Goodbye!")
             break
         
+        # Pin the current intents snapshot for this turn
+        intents = current_intents()
+        
         # Try to match the text with intents
         response = enhanced_match_intent(text, intents)
         
         if not response:
             # If no match found, use the transformer model for generating a response
+            INTENT_STATS.record_generation()
             conversation_history.append(text)
             response = generate_response(chatbot, tokenizer, text, conversation_history)
         
@@ -172,6 +183,10 @@ def chat():
         # Print and speak the response
         print(f"Bot: {response}")
         speak_macos(response)
+        
+        # Offer to learn the utterances we could not match, now that the
+        # reply is out
+        review_learning_queue(intents, update_intents)
 
 def check_dependencies():
     """
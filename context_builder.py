@@ -0,0 +1,103 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+DEFAULT_MAX_TOKENS = 128  # prompt tokens, leaving room for the reply within max_length=200
+DEFAULT_CACHE_SIZE = 4096  # turns whose token ids are kept
+
+_BUILDERS = weakref.WeakKeyDictionary()
+_BUILDERS_LOCK = threading.Lock()
+
+
+class ContextBuilder:
+    """
+    Assembles the model prompt from a conversation as token ids.
+
+    Every turn is encoded once, followed by EOS as DialoGPT was trained,
+    and its ids are cached, so a request only tokenizes its new turn. The
+    prompt is the new turn plus as many of the most recent turns as fit in
+    max_tokens, which keeps prompt length (and so latency) predictable no
+    matter how long the turns are.
+    """
+
+    def __init__(self, tokenizer, max_tokens=DEFAULT_MAX_TOKENS, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Args:
+            tokenizer: Tokenizer of the model
+            max_tokens: Longest prompt, in tokens
+            cache_size: Most turns whose token ids are cached
+        """
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.cache_size = cache_size
+        self._turns = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def encode_turn(self, text):
+        """
+        Token ids of one turn followed by EOS, cached by its text.
+        """
+        with self._lock:
+            ids = self._turns.get(text)
+            if ids is not None:
+                self._turns.move_to_end(text)
+                self.hits += 1
+                return ids
+
+        ids = tuple(self.tokenizer.encode(text)) + (self.tokenizer.eos_token_id,)
+        with self._lock:
+            self.misses += 1
+            self._turns[text] = ids
+            if len(self._turns) > self.cache_size:
+                self._turns.popitem(last=False)
+        return ids
+
+    def build(self, history, text):
+        """
+        Prompt token ids for text after the turns in history.
+
+        history may already end with text, as the chat loops append the
+        user's turn before generating. An over-long turn keeps its end.
+        """
+        history = list(history or ())
+        if history and history[-1] == text:
+            history.pop()
+
+        prompt = list(self.encode_turn(text)[-self.max_tokens:])
+        budget = self.max_tokens - len(prompt)
+        turns = []
+        for turn in reversed(history):
+            ids = self.encode_turn(turn)
+            budget -= len(ids)
+            if budget < 0:
+                break
+            turns.append(ids)
+
+        context = [token for ids in reversed(turns) for token in ids]
+        return context + prompt
+
+    def stats(self):
+        """
+        Turn cache counters as a dict.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "turns": len(self._turns),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+
+def get_context_builder(tokenizer):
+    """
+    The shared ContextBuilder of a tokenizer.
+    """
+    with _BUILDERS_LOCK:
+        builder = _BUILDERS.get(tokenizer)
+        if builder is None:
+            builder = _BUILDERS[tokenizer] = ContextBuilder(tokenizer)
+        return builder
@@ -0,0 +1,86 @@
+import argparse
+import csv
+import time
+from collections import Counter
+
+from intent_index import IntentIndex, load_intent_document, match_batch
+from intent_similarity import SIMILARITY_THRESHOLD
+
+
+def load_replay(path):
+    """
+    Load (utterance, expected tag) pairs to replay.
+
+    CSV files need a pattern (or utterance) column and may carry a tag
+    column; any other file is read as one utterance per line with no
+    expected tag.
+    """
+    if not path.endswith('.csv'):
+        with open(path, 'r', encoding='utf-8') as file:
+            return [(line.strip(), None) for line in file if line.strip()]
+
+    with open(path, 'r', newline='', encoding='utf-8') as csvfile:
+        reader = csv.DictReader(csvfile)
+        column = 'pattern' if 'pattern' in reader.fieldnames else 'utterance'
+        return [(row[column], row.get('tag')) for row in reader]
+
+
+def evaluate(index, replay, threshold, workers):
+    """
+    Replay utterances through the matcher and summarise the outcome.
+    """
+    start = time.perf_counter()
+    results = match_batch((text for text, _ in replay), index, threshold, workers=workers)
+    elapsed = time.perf_counter() - start
+
+    labels = {expected for _, expected in replay if expected is not None}
+    if labels and not labels & set(index.tags):
+        print("Warning: no replayed tag is an intent of the index, so accuracy is 0 by construction")
+
+    labelled = 0
+    correct = 0
+    misses = Counter()
+    for (text, expected), (tag, _) in zip(replay, results):
+        if tag is None:
+            misses[text] += 1
+        if expected is not None:
+            labelled += 1
+            correct += tag == expected
+
+    print(f"Utterances:   {len(replay)}")
+    print(f"Matched:      {len(replay) - sum(misses.values())}")
+    print(f"Misses:       {sum(misses.values())}")
+    if labelled:
+        print(f"Accuracy:     {correct / labelled:.2%} of {labelled} labelled utterances")
+    print(f"Throughput:   {len(replay) / elapsed:,.0f} utterances/s ({elapsed:.2f}s)")
+    if misses:
+        print("Most common misses:")
+        for text, count in misses.most_common(10):
+            print(f"  {count:>5}  {text}")
+
+
+def main():
+    """
+    Replay intents.csv or recorded traffic through the intent matcher offline.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--intents', default=None,
+                        help="intents to match against (.json or .csv; defaults to a .csv replay "
+                             "file itself, otherwise intents.json)")
+    parser.add_argument('--replay', default='intents.csv',
+                        help="utterances to replay (.csv with pattern/tag columns, or one per line)")
+    parser.add_argument('--threshold', type=float, default=SIMILARITY_THRESHOLD)
+    parser.add_argument('--workers', type=int, default=0,
+                        help="worker processes (0 matches in-process)")
+    args = parser.parse_args()
+
+    if args.intents is None:
+        # intents.csv and intents.json share no tags, so a labelled replay is
+        # scored against its own intents unless told otherwise
+        args.intents = args.replay if args.replay.endswith('.csv') else 'intents.json'
+    index = IntentIndex.from_document(load_intent_document(args.intents))
+    evaluate(index, load_replay(args.replay), args.threshold, args.workers)
+
+
+if __name__ == "__main__":
+    main()
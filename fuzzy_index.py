@@ -0,0 +1,133 @@
+import re
+from collections import Counter
+
+MAX_EDIT_DISTANCE = 2
+# Only the first PREFIX_LENGTH characters of a word get delete variants,
+# which bounds the index size without losing candidates (as in SymSpell)
+PREFIX_LENGTH = 7
+# Shorter tokens are too ambiguous to correct ("hat" vs "has" vs "had")
+MIN_TOKEN_LENGTH = 3
+# Tokens up to this long are corrected by at most one edit
+SHORT_TOKEN_LENGTH = 4
+
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+def deletes(word, max_distance):
+    """
+    Every string obtained by deleting up to max_distance characters from word.
+    """
+    variants = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {
+            variant[:i] + variant[i + 1:]
+            for variant in frontier
+            for i in range(len(variant))
+        }
+        variants |= frontier
+    return variants
+
+
+def edit_distance(first, second, max_distance):
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent
+    transpositions) between first and second, or max_distance + 1 as soon as
+    it is known to exceed max_distance.
+    """
+    if abs(len(first) - len(second)) > max_distance:
+        return max_distance + 1
+
+    previous_previous = None
+    previous = list(range(len(second) + 1))
+    for i, first_char in enumerate(first, 1):
+        current = [i] + [0] * len(second)
+        for j, second_char in enumerate(second, 1):
+            cost = first_char != second_char
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (i > 1 and j > 1 and first_char == second[j - 2]
+                    and first[i - 2] == second_char):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+class SpellingIndex:
+    """
+    SymSpell-style index of the words used in intent patterns.
+
+    Each word is stored under every variant obtained by deleting up to
+    max_distance characters from its prefix. A misrecognized token is looked
+    up by generating its own delete variants, so finding every word within
+    the edit distance costs a handful of dictionary lookups, independent of
+    the vocabulary size.
+    """
+
+    __slots__ = ('words', 'variants', 'max_distance', 'prefix_length')
+
+    def __init__(self, words, max_distance=MAX_EDIT_DISTANCE, prefix_length=PREFIX_LENGTH):
+        """
+        Args:
+            words: Iterable of words; repeated words count as more frequent
+            max_distance: Largest edit distance that can be looked up
+            prefix_length: Characters of each word that get delete variants
+        """
+        self.words = Counter(words)
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.variants = {}
+        for word in self.words:
+            if len(word) >= MIN_TOKEN_LENGTH:
+                for variant in deletes(word[:prefix_length], max_distance):
+                    self.variants.setdefault(variant, []).append(word)
+
+    def __len__(self):
+        return len(self.words)
+
+    def lookup(self, token, max_distance=None):
+        """
+        Closest known word to token as (word, distance), preferring the more
+        frequent word on ties, or (None, None) if none is within max_distance.
+        """
+        if token in self.words:
+            return token, 0
+        if max_distance is None:
+            max_distance = self.max_distance
+        max_distance = min(max_distance, self.max_distance)
+
+        best = None
+        best_key = None
+        seen = set()
+        for variant in deletes(token[:self.prefix_length], max_distance):
+            for word in self.variants.get(variant, ()):
+                if word in seen:
+                    continue
+                seen.add(word)
+                distance = edit_distance(token, word, max_distance)
+                if distance > max_distance:
+                    continue
+                key = (distance, -self.words[word], word)
+                if best_key is None or key < best_key:
+                    best = word
+                    best_key = key
+        if best is None:
+            return None, None
+        return best, best_key[0]
+
+    def correct(self, text_lower):
+        """
+        text_lower with every unknown token replaced by its closest known
+        word. Tokens of up to SHORT_TOKEN_LENGTH characters are corrected by
+        one edit at most, longer ones by up to max_distance edits.
+        """
+        def replace(match):
+            token = match.group()
+            if len(token) < MIN_TOKEN_LENGTH or token in self.words:
+                return token
+            max_distance = 1 if len(token) <= SHORT_TOKEN_LENGTH else self.max_distance
+            word, _ = self.lookup(token, max_distance)
+            return word or token
+
+        return WORD_PATTERN.sub(replace, text_lower)
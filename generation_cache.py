@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+DEFAULT_MAXSIZE = 4096
+DEFAULT_MAX_BYTES = 16 * 2 ** 20
+DEFAULT_TTL = 3600  # seconds
+DEFAULT_DISK_MAXSIZE = 100000
+PRUNE_INTERVAL = 256  # disk writes between pruning expired and excess rows
+
+
+def generation_key(token_ids, **params):
+    """
+    Hex digest identifying a generation: the exact context token ids plus
+    every parameter that changes the output (model, lengths, decoding).
+    """
+    digest = hashlib.sha256(array('l', token_ids).tobytes())
+    digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def model_params(model):
+    """
+    Parameters identifying the model in generation keys: its name or path,
+    its class (PyTorch and ONNX Runtime models differ) and whether its
+    layers are quantized.
+    """
+    modules = model.modules() if hasattr(model, 'modules') else ()
+    quantized = any(type(module).__module__.startswith('torch.ao.nn.quantized') for module in modules)
+    return {"model": model.config.name_or_path, "backend": type(model).__name__, "quantized": quantized}
+
+
+class GenerationCache:
+    """
+    Bounded LRU cache with a TTL for model generations.
+
+    Keys come from generation_key(), so any change to the context or the
+    generation parameters is a different entry, and a hit is exactly what
+    greedy decoding would have produced again. Values are JSON-serializable
+    replies (text, or token ids); the cache is bounded both by entries and
+    by their encoded size.
+
+    With a path, entries are also written to an SQLite file, which outlives
+    restarts and is shared by every process (e.g. Flask or gunicorn
+    workers) opening it. Memory misses fall through to the file, and hits
+    there are promoted into memory.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL,
+                 path=None, disk_maxsize=DEFAULT_DISK_MAXSIZE):
+        """
+        Args:
+            maxsize: Maximum number of entries in memory
+            max_bytes: Maximum encoded size of the entries in memory
+            ttl: Seconds an entry stays valid (None for no expiry)
+            path: Optional SQLite file for the on-disk tier
+            disk_maxsize: Maximum number of entries on disk
+        """
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self.disk_maxsize = disk_maxsize
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS generations "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, used_at REAL NOT NULL)"
+            )
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Cache sized by GENERATION_CACHE_SIZE, GENERATION_CACHE_MB and
+        GENERATION_CACHE_TTL, with the disk tier at GENERATION_CACHE_PATH
+        when it is set. GENERATION_CACHE_SIZE=0 turns caching off (None).
+        """
+        maxsize = int(os.environ.get('GENERATION_CACHE_SIZE', DEFAULT_MAXSIZE))
+        if maxsize <= 0:
+            return None
+        ttl = float(os.environ.get('GENERATION_CACHE_TTL', DEFAULT_TTL))
+        return cls(
+            maxsize=maxsize,
+            max_bytes=int(float(os.environ.get('GENERATION_CACHE_MB', DEFAULT_MAX_BYTES / 2 ** 20)) * 2 ** 20),
+            ttl=ttl if ttl > 0 else None,
+            path=os.environ.get('GENERATION_CACHE_PATH') or None
+        )
+
+    def get(self, key):
+        """
+        Cached value for key, or None.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, size, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+                self.expirations += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM generations WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and (row[1] is None or row[1] > now):
+                    self._db.execute("UPDATE generations SET used_at = ? WHERE key = ?", (now, key))
+                    value = json.loads(row[0])
+                    self._insert(key, value, len(row[0]), row[1])
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """
+        Cache value for key, evicting least recently used entries while
+        over maxsize or max_bytes.
+        """
+        encoded = json.dumps(value)
+        now = time.time()
+        expires_at = None if self.ttl is None else now + self.ttl
+        with self._lock:
+            self._insert(key, value, len(encoded), expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO generations (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+                    (key, encoded, expires_at, now)
+                )
+                self._writes += 1
+                if self._writes % PRUNE_INTERVAL == 0:
+                    self._prune(now)
+
+    def _insert(self, key, value, size, expires_at):
+        """
+        Add an entry to memory and evict down to the bounds. Must be called
+        with the lock held.
+        """
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, size, expires_at)
+        self._bytes += size
+        while len(self._entries) > self.maxsize or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _prune(self, now):
+        """
+        Delete expired rows, then the least recently used ones over disk_maxsize.
+        """
+        self._db.execute("DELETE FROM generations WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        self._db.execute(
+            "DELETE FROM generations WHERE key IN "
+            "(SELECT key FROM generations ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+            (self.disk_maxsize,)
+        )
+
+    def clear(self):
+        """
+        Drop every entry, on disk too.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM generations")
+
+    def stats(self):
+        """
+        Counters and current size as a dict.
+        """
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            stats = {
+                "size": len(self._entries),
+                "bytes": self._bytes,
+                "maxsize": self.maxsize,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0
+            }
+            if self._db is not None:
+                stats["disk_size"] = self._db.execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+            return stats
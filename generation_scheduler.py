@@ -0,0 +1,205 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_MAX_WAIT = 0.01  # seconds to wait for more prompts after the first
+DEFAULT_MAX_LENGTH = 200  # prompt plus reply tokens, as in initialize_chatbot()
+
+
+class GenerationScheduler:
+    """
+    Dynamic micro-batching in front of model.generate().
+
+    Requests from concurrent threads are queued; a single worker thread
+    takes the first waiting prompt, collects more for up to max_wait
+    seconds (or until max_batch_size), pads them into one batch and runs a
+    single generate() call for all of them. Prompt plus reply stay within
+    max_length and the model's n_positions; replies to shorter prompts that
+    run out of that padded budget are continued in a follow-up call. On CPU one batched forward pass
+    costs far less than the same prompts one at a time, so throughput grows
+    with concurrency while a lone request waits at most max_wait extra.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait=DEFAULT_MAX_WAIT, max_length=DEFAULT_MAX_LENGTH, **generate_kwargs):
+        """
+        Args:
+            model: Causal language model, e.g. the model of the chatbot pipeline
+            tokenizer: Its tokenizer
+            max_batch_size: Most prompts run in one generate() call
+            max_wait: Seconds to wait for more prompts before running a batch
+            max_length: Longest prompt plus reply, in tokens
+            generate_kwargs: Extra arguments for model.generate()
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_length = max_length
+        self.generate_kwargs = generate_kwargs
+        self.pad_token_id = tokenizer.pad_token_id
+        if self.pad_token_id is None:
+            self.pad_token_id = tokenizer.eos_token_id
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.generated_tokens = 0
+        self.busy_seconds = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="generation-scheduler", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_pipeline(cls, chatbot, **kwargs):
+        """
+        Scheduler over the model and tokenizer of a text-generation pipeline.
+        """
+        return cls(chatbot.model, chatbot.tokenizer, **kwargs)
+
+    @classmethod
+    def from_environment(cls, chatbot):
+        """
+        from_pipeline() sized by GENERATION_MAX_BATCH and GENERATION_MAX_WAIT_MS.
+        """
+        return cls.from_pipeline(
+            chatbot,
+            max_batch_size=int(os.environ.get('GENERATION_MAX_BATCH', DEFAULT_MAX_BATCH_SIZE)),
+            max_wait=float(os.environ.get('GENERATION_MAX_WAIT_MS', DEFAULT_MAX_WAIT * 1000)) / 1000
+        )
+
+    def submit(self, prompt):
+        """
+        Queue a prompt (text, or token ids from a ContextBuilder) and return
+        a Future resolving to the generated reply.
+        """
+        future = Future()
+        self._queue.put((prompt, future))
+        return future
+
+    def generate(self, prompt, timeout=None):
+        """
+        Generate a reply to prompt, blocking until its batch has run.
+        """
+        return self.submit(prompt).result(timeout)
+
+    def _collect(self):
+        """
+        Block for the first request, then gather more until the batch is
+        full or max_wait has passed.
+        """
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [(prompt, future) for prompt, future in self._collect()
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            start = time.perf_counter()
+            try:
+                replies, tokens = self._generate([prompt for prompt, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), reply in zip(batch, replies):
+                future.set_result(reply)
+
+            with self._lock:
+                self.batches += 1
+                self.requests += len(batch)
+                self.generated_tokens += tokens
+                self.busy_seconds += time.perf_counter() - start
+
+    def _generate(self, prompts):
+        """
+        Generate a reply to every prompt in as few padded generate() calls
+        as possible and return (replies, generated tokens).
+        """
+        # Prompt plus reply never exceeds the model's positions
+        limit = min(self.max_length, getattr(self.model.config, 'n_positions', None) or self.max_length)
+        # Decoder-only models continue from the last token, so pad (and cut
+        # over-long prompts) on the left
+        sequences = [
+            list(self.tokenizer.encode(prompt) if isinstance(prompt, str) else prompt)[-(limit - 1):]
+            for prompt in prompts
+        ]
+        replies = [[] for _ in sequences]
+        pending = list(range(len(sequences)))
+        while pending:
+            rows = self._generate_padded([sequences[i] for i in pending], limit)
+            unfinished = []
+            for i, (row, finished) in zip(pending, rows):
+                replies[i].extend(row)
+                sequences[i].extend(row)
+                # A prompt shorter than the longest in its batch can run out
+                # of new tokens before it would alone; continue it, so every
+                # reply is the one it would get alone (and the same
+                # generation cache entry)
+                if not finished and len(sequences[i]) < limit:
+                    unfinished.append(i)
+            pending = unfinished
+
+        tokens = sum(len(reply) for reply in replies)
+        return [self.tokenizer.decode(reply, skip_special_tokens=True).strip() for reply in replies], tokens
+
+    def _generate_padded(self, sequences, limit):
+        """
+        Run one left-padded generate() call, with new tokens up to limit
+        for the longest sequence. Returns (new tokens, whether the reply
+        ended) per sequence.
+        """
+        prompt_length = max(len(sequence) for sequence in sequences)
+        input_ids = torch.tensor([[self.pad_token_id] * (prompt_length - len(sequence)) + sequence
+                                  for sequence in sequences])
+        attention_mask = torch.tensor([[0] * (prompt_length - len(sequence)) + [1] * len(sequence)
+                                       for sequence in sequences])
+        with torch.no_grad():
+            outputs = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                max_new_tokens=limit - prompt_length,
+                pad_token_id=self.pad_token_id,
+                **self.generate_kwargs
+            )
+
+        rows = []
+        eos_token_id = self.tokenizer.eos_token_id
+        for row in outputs[:, prompt_length:].tolist():
+            # Finished rows are padded after their end of sequence token
+            if eos_token_id in row:
+                rows.append((row[:row.index(eos_token_id)], True))
+            else:
+                rows.append((row, False))
+        return rows
+
+    def stats(self):
+        """
+        Batching counters as a dict.
+        """
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+                "pending": self._queue.qsize(),
+                "generated_tokens": self.generated_tokens,
+                "tokens_per_second": self.generated_tokens / self.busy_seconds if self.busy_seconds else 0.0
+            }
@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAXSIZE = 1024
+DEFAULT_TTL = 300  # seconds
+
+
+class IntentCache:
+    """
+    Bounded LRU cache with a TTL in front of intent matching.
+
+    Keys are normalized utterances and values are resolved (position, score)
+    pairs, so every hit still picks a fresh random response. The cache is
+    bound to the version of the IntentIndex snapshot its entries were
+    computed against: looking up with another version (after load_intents,
+    update_intents or the file watcher published a new one) drops every
+    entry first. Only the version is kept, so old snapshots are not pinned
+    in memory by the cache.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL):
+        """
+        Args:
+            maxsize: Maximum number of cached utterances
+            ttl: Seconds an entry stays valid (None for no expiry)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _bind(self, index):
+        """
+        Drop all entries if they were computed against another snapshot.
+        Must be called with the lock held.
+        """
+        if self._version != index.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._version = index.version
+
+    def get(self, index, key):
+        """
+        Cached value for key under index, or None.
+        """
+        with self._lock:
+            self._bind(index)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, index, key, value):
+        """
+        Cache value for key under index, evicting the least recently used entry if full.
+        """
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._bind(index)
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Drop every entry.
+        """
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._version = None
+
+    def stats(self):
+        """
+        Counters and current size as a dict.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
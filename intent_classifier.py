@@ -0,0 +1,373 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+import intent_similarity
+from intent_index import load_intent_document, normalize_utterance, tokenize
+from intent_similarity import char_ngrams, hash_ngram, np, sparse
+
+DEFAULT_MODEL_PATH = 'intent_classifier.npz'
+NUM_FEATURES = 2 ** 14
+CHAR_NGRAM_SIZES = (3, 4)
+EPOCHS = 60
+LEARNING_RATE = 0.1
+L2 = 1e-5
+# Share of each tag's patterns held out to calibrate the confidence
+CALIBRATION_SHARE = 0.2
+CONFIDENCE_THRESHOLD = 0.35
+# Upper bound of the fitted temperature, reached when the held-out logits
+# say nothing about the labels
+MAX_TEMPERATURE = 1000.0
+# Below this training accuracy the classifier is not saved
+MIN_TRAINING_ACCURACY = 0.5
+
+# Set INTENT_BACKEND=classifier to match with the trained classifier
+# instead of the similarity and spelling passes
+BACKEND_VARIABLE = 'INTENT_BACKEND'
+
+
+def features(text, num_features=NUM_FEATURES):
+    """
+    Hashed feature ids of a lowercased text: word unigrams and bigrams plus
+    character n-grams.
+    """
+    words = tokenize(text)
+    grams = [f"w:{word}" for word in words]
+    grams.extend(f"b:{first} {second}" for first, second in zip(words, words[1:]))
+    for size in CHAR_NGRAM_SIZES:
+        grams.extend(f"c:{ngram}" for ngram in char_ngrams(text, size))
+    return [hash_ngram(gram, num_features) for gram in grams]
+
+
+def vectorize(texts, num_features=NUM_FEATURES):
+    """
+    L2-normalized sparse matrix with one row of hashed features per text.
+    """
+    rows = []
+    cols = []
+    for row, text in enumerate(texts):
+        ids = features(text, num_features)
+        rows.extend([row] * len(ids))
+        cols.extend(ids)
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+        shape=(len(texts), num_features)
+    )
+    matrix.sum_duplicates()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return (sparse.diags(1.0 / norms).astype(np.float32) @ matrix).tocsr()
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def _fit(matrix, targets, epochs=EPOCHS, learning_rate=LEARNING_RATE):
+    """
+    Multinomial logistic regression by full-batch Adam. Returns (weights, bias).
+
+    Args:
+        matrix: Sparse features, one row per distinct text
+        targets: Dense (texts, classes) array counting each text's examples per class
+    """
+    # Only the features that occur in the training set can get a non-zero
+    # weight, so train over those columns and scatter them back at the end
+    num_features = matrix.shape[1]
+    active = np.unique(matrix.indices)
+    matrix = matrix[:, active]
+    examples = targets.sum(axis=1, keepdims=True)
+    num_examples = examples.sum()
+
+    # Start from the class centroids, which is already a decent classifier
+    weights = np.asarray((matrix.T @ targets) / np.maximum(targets.sum(axis=0), 1.0), dtype=np.float32)
+    bias = np.zeros(targets.shape[1], dtype=np.float32)
+    transposed = matrix.T.tocsr()
+
+    moments = [np.zeros_like(weights), np.zeros_like(bias)]
+    velocities = [np.zeros_like(weights), np.zeros_like(bias)]
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+    for step in range(1, epochs + 1):
+        # A text seen under several tags contributes one gradient per example
+        errors = (_softmax(matrix @ weights + bias) * examples - targets) / num_examples
+        gradients = [transposed @ errors + L2 * weights, errors.sum(axis=0)]
+        for parameter, gradient, moment, velocity in zip((weights, bias), gradients, moments, velocities):
+            moment *= beta1
+            moment += (1 - beta1) * gradient
+            velocity *= beta2
+            velocity += (1 - beta2) * gradient * gradient
+            step_size = learning_rate * np.sqrt(1 - beta2 ** step) / (1 - beta1 ** step)
+            parameter -= step_size * moment / (np.sqrt(velocity) + epsilon)
+
+    full_weights = np.zeros((num_features, targets.shape[1]), dtype=np.float32)
+    full_weights[active] = weights
+    return full_weights, bias
+
+
+def _temperature_loss(logits, labels, inverse_temperature):
+    """
+    Negative log-likelihood of labels under softmax(logits * inverse_temperature).
+    """
+    scaled = logits * inverse_temperature
+    top = scaled.max(axis=-1)
+    log_norm = top + np.log(np.exp(scaled - top[:, None]).sum(axis=-1))
+    return float((log_norm - scaled[np.arange(len(labels)), labels]).mean())
+
+
+def _fit_temperature(logits, labels, iterations=50):
+    """
+    Temperature minimizing the negative log-likelihood of held-out logits.
+
+    The loss is convex in the inverse temperature, so Newton's method with a
+    step-halving line search finds the minimum without a fixed search range.
+    When the logits carry no information about the labels the minimum is at
+    an infinite temperature; the result is then capped at MAX_TEMPERATURE.
+    """
+    logits = np.asarray(logits, dtype=np.float64)
+    labels = np.asarray(labels)
+    inverse = 1.0
+    loss = _temperature_loss(logits, labels, inverse)
+    for _ in range(iterations):
+        probabilities = _softmax(logits * inverse)
+        expected = (probabilities * logits).sum(axis=-1)
+        gradient = (expected - logits[np.arange(len(labels)), labels]).mean()
+        curvature = ((probabilities * logits * logits).sum(axis=-1) - expected * expected).mean()
+        if curvature <= 0:
+            break
+        step = gradient / curvature
+        # Halve the step until the loss goes down, staying at a positive
+        # inverse temperature
+        while True:
+            candidate = max(inverse - step, 1.0 / MAX_TEMPERATURE)
+            candidate_loss = _temperature_loss(logits, labels, candidate)
+            if candidate_loss <= loss or abs(step) < 1e-9:
+                break
+            step /= 2
+        converged = abs(candidate - inverse) <= 1e-6 * inverse
+        inverse, loss = candidate, candidate_loss
+        if converged:
+            break
+    return 1.0 / inverse
+
+
+class IntentClassifier:
+    """
+    Linear intent classifier over hashed word and character n-grams.
+
+    Trains in seconds on CPU and classifies one utterance with a gather and
+    a sum over the rows of its features, well under a millisecond. The
+    softmax is temperature-scaled on held-out patterns, so the confidence
+    can be compared against a threshold.
+    """
+
+    def __init__(self, tags, weights, bias, temperature=1.0):
+        """
+        Args:
+            tags: Tag of every class
+            weights: float32 array of shape (num_features, num_classes)
+            bias: float32 array of shape (num_classes,)
+            temperature: Softmax temperature fitted on held-out patterns
+        """
+        self.tags = tuple(tags)
+        self.weights = weights
+        self.bias = bias
+        self.temperature = temperature
+
+    @property
+    def num_features(self):
+        return self.weights.shape[0]
+
+    @classmethod
+    def train(cls, intents, epochs=EPOCHS, num_features=NUM_FEATURES, seed=0):
+        """
+        Train on an {"intents": [...]} document, one example per pattern.
+        """
+        tags = []
+        positions = {}
+        examples = []
+        for intent in intents['intents']:
+            tag = intent.get('tag')
+            if not tag:
+                continue
+            label = positions.get(tag)
+            if label is None:
+                label = positions[tag] = len(tags)
+                tags.append(tag)
+            examples.extend((normalize_utterance(pattern), label) for pattern in intent['patterns'])
+
+        examples = list(dict.fromkeys(examples))
+        rows = {}
+        for text, _ in examples:
+            rows.setdefault(text, len(rows))
+        matrix = vectorize(list(rows), num_features)
+        text_rows = np.array([rows[text] for text, _ in examples])
+        labels = np.array([label for _, label in examples])
+
+        def targets(selected):
+            counts = np.zeros((len(rows), len(tags)), dtype=np.float32)
+            np.add.at(counts, (text_rows[selected], labels[selected]), 1.0)
+            return counts
+
+        # Hold out a share of the patterns of every tag that has several,
+        # fit the temperature on them, then train again on everything
+        rng = random.Random(seed)
+        by_label = {}
+        for example, label in enumerate(labels):
+            by_label.setdefault(int(label), []).append(example)
+        held_out = []
+        for label_examples in by_label.values():
+            if len(label_examples) > 1:
+                rng.shuffle(label_examples)
+                held_out.extend(label_examples[:max(1, int(len(label_examples) * CALIBRATION_SHARE))])
+
+        temperature = 1.0
+        if held_out:
+            mask = np.ones(len(labels), dtype=bool)
+            mask[held_out] = False
+            weights, bias = _fit(matrix, targets(mask), epochs)
+            logits = matrix[text_rows[held_out]] @ weights + bias
+            temperature = _fit_temperature(logits, labels[held_out])
+
+        weights, bias = _fit(matrix, targets(np.ones(len(labels), dtype=bool)), epochs)
+        return cls(tags, weights, bias, temperature)
+
+    def save(self, path=DEFAULT_MODEL_PATH):
+        """
+        Save the model as a single .npz file.
+        """
+        np.savez_compressed(
+            path,
+            tags=np.array(self.tags),
+            weights=self.weights,
+            bias=self.bias,
+            temperature=np.float32(self.temperature)
+        )
+
+    @classmethod
+    def load(cls, path=DEFAULT_MODEL_PATH):
+        """
+        Load a model saved with save().
+        """
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                [str(tag) for tag in data['tags']],
+                data['weights'],
+                data['bias'],
+                float(data['temperature'])
+            )
+
+    def probabilities(self, text_lower):
+        """
+        Calibrated probability of every tag for a lowercased text.
+        """
+        ids = features(text_lower, self.num_features)
+        ids, counts = np.unique(ids, return_counts=True)
+        values = counts / np.sqrt(np.dot(counts, counts))
+        logits = values.astype(np.float32) @ self.weights[ids] + self.bias
+        return _softmax(logits / self.temperature)
+
+    def classify(self, text_lower, threshold=CONFIDENCE_THRESHOLD):
+        """
+        (tag, confidence) for a lowercased text, with tag None when the
+        confidence is below threshold.
+        """
+        probabilities = self.probabilities(text_lower)
+        best = int(np.argmax(probabilities))
+        confidence = float(probabilities[best])
+        if confidence < threshold:
+            return None, confidence
+        return self.tags[best], confidence
+
+
+def load_classifier(path=DEFAULT_MODEL_PATH):
+    """
+    Load the classifier at path, or None if it (or NumPy/SciPy) is missing.
+    """
+    if not intent_similarity.is_available():
+        return None
+    try:
+        return IntentClassifier.load(path)
+    except OSError:
+        return None
+
+
+def load_backend(path=DEFAULT_MODEL_PATH):
+    """
+    The classifier when INTENT_BACKEND=classifier, otherwise None.
+    """
+    if os.environ.get(BACKEND_VARIABLE, 'index') != 'classifier':
+        return None
+    classifier = load_classifier(path)
+    if classifier is None:
+        print(f"Intent classifier {path} not found (train it with intent_classifier.py); "
+              "using the intent index instead.")
+    return classifier
+
+
+def classify_intent(index, classifier, text_lower, threshold=CONFIDENCE_THRESHOLD):
+    """
+    (position, score) of text_lower in index with the classifier backend.
+
+    Exact patterns still win with a score of 1.0; otherwise the classifier
+    replaces the similarity and spelling passes and its calibrated confidence
+    is the score. Position is None on a miss, or when the predicted tag is
+    not in index.
+    """
+    position = index.match(text_lower)
+    if position is not None:
+        return position, 1.0
+    tag, confidence = classifier.classify(text_lower, threshold)
+    if tag is None:
+        return None, confidence
+    return index.position_of(tag), confidence
+
+
+def main():
+    """
+    Train the hashed n-gram intent classifier on intents.json or intents.csv.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--intents', default='intents.json',
+                        help="training intents (.json or .csv)")
+    parser.add_argument('--output', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    parser.add_argument('--features', type=int, default=NUM_FEATURES,
+                        help="size of the hashed feature space")
+    parser.add_argument('--min-accuracy', type=float, default=MIN_TRAINING_ACCURACY,
+                        help="refuse to save below this training accuracy")
+    args = parser.parse_args()
+
+    intents = load_intent_document(args.intents)
+    start = time.perf_counter()
+    classifier = IntentClassifier.train(intents, args.epochs, args.features)
+    elapsed = time.perf_counter() - start
+
+    patterns = [(normalize_utterance(pattern), intent.get('tag'))
+                for intent in intents['intents'] for pattern in intent['patterns']]
+    start = time.perf_counter()
+    correct = sum(classifier.classify(text, 0.0)[0] == tag for text, tag in patterns)
+    latency = (time.perf_counter() - start) / max(len(patterns), 1)
+    accuracy = correct / max(len(patterns), 1)
+
+    print(f"Trained on {len(patterns)} patterns, {len(classifier.tags)} tags in {elapsed:.2f}s "
+          f"(temperature {classifier.temperature:.2f})")
+    print(f"Training accuracy: {accuracy:.2%}")
+    print(f"Latency: {latency * 1e6:.0f} us/utterance")
+    if accuracy < args.min_accuracy:
+        # Typically the same patterns are spread over many tags, so no
+        # classifier can tell them apart; the temperature then goes to
+        # its cap and every confidence falls below the threshold
+        print(f"Training accuracy is below {args.min_accuracy:.0%}; not writing {args.output}. "
+              "Check for patterns shared by several tags.")
+        sys.exit(1)
+    classifier.save(args.output)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
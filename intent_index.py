@@ -0,0 +1,845 @@
+import csv
+import json
+import random
+import re
+import sys
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count, islice
+
+import intent_similarity
+from fuzzy_index import SpellingIndex
+from intent_similarity import SIMILARITY_THRESHOLD, NgramSimilarity
+
+# Compiled indexes keyed by id() of the raw intents document they were built from
+_INDEX_CACHE = {}
+_INDEX_CACHE_SIZE = 8
+
+# Every IntentIndex snapshot gets the next version; later snapshots are newer
+_VERSIONS = count(1)
+
+# (IntentIndex, threshold) held by each match_batch worker process
+_BATCH_WORKER = None
+BATCH_CHUNK_SIZE = 1024
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+# Function words never narrow the candidate set, so they get no postings
+STOPWORDS = frozenset([
+    "a", "an", "the", "and", "or", "but", "of", "to", "in", "on", "at", "for",
+    "with", "about", "by", "from", "is", "are", "am", "was", "be", "it",
+    "this", "that", "i", "i'm", "me", "my", "you", "your", "we", "our", "do",
+    "does", "can", "could", "will", "would", "should", "please"
+])
+
+# Tokens found in more than this share of patterns are not informative
+MAX_TOKEN_SHARE = 0.25
+# ...unless the corpus is so small that every token is "common"
+MIN_TOKEN_LIMIT = 32
+# Utterances with no indexed token (typically misrecognized words) are still
+# scored against every pattern while the corpus is at most this large
+FULL_SCAN_LIMIT = 5000
+
+# Topics offered when nothing matched; few enough to be spoken aloud
+SUGGESTION_COUNT = 3
+
+
+class PatternAutomaton:
+    """
+    Aho-Corasick automaton over lowercased intent patterns.
+
+    Every pattern carries a priority (its intent's position in the intents
+    file). A single left-to-right pass over the text finds all patterns that
+    occur in it and reports the lowest priority, which reproduces the
+    "first intent in file order wins" behaviour of the original nested loop.
+    """
+
+    def __init__(self, patterns):
+        """
+        Build the automaton from an iterable of (pattern, priority) pairs.
+        """
+        self._goto = [{}]
+        self._fail = [0]
+        self._own = [None]
+        self._best = [None]
+
+        for pattern, priority in patterns:
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._own.append(None)
+                    self._best.append(None)
+                    self._goto[state][char] = next_state
+                state = next_state
+            if self._own[state] is None or priority < self._own[state]:
+                self._own[state] = priority
+
+        self._link()
+
+    def _link(self):
+        """
+        Compute failure links breadth-first and fold the best priority of
+        every suffix state into each state.
+        """
+        self._best[0] = self._own[0]
+        queue = deque()
+        for state in self._goto[0].values():
+            self._fail[state] = 0
+            self._best[state] = _min_priority(self._own[state], self._best[0])
+            queue.append(state)
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._best[next_state] = _min_priority(
+                    self._own[next_state], self._best[self._fail[next_state]]
+                )
+                queue.append(next_state)
+
+    def __len__(self):
+        return len(self._goto)
+
+    def first_match(self, text):
+        """
+        Return the lowest priority of any pattern occurring in text, or None.
+        """
+        goto = self._goto
+        fail = self._fail
+        best_by_state = self._best
+
+        best = best_by_state[0]
+        if best == 0:
+            return best
+
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            found = best_by_state[state]
+            if found is not None and (best is None or found < best):
+                best = found
+                if best == 0:
+                    break
+        return best
+
+
+def _min_priority(first, second):
+    """
+    Minimum of two optional priorities.
+    """
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return min(first, second)
+
+
+def normalize_utterance(text):
+    """
+    Lowercase text and collapse runs of whitespace, the form utterances are
+    matched and cached in.
+    """
+    return " ".join(text.lower().split())
+
+
+def tokenize(text_lower):
+    """
+    Split lowercased text into word tokens.
+    """
+    return TOKEN_PATTERN.findall(text_lower)
+
+
+class TokenIndex:
+    """
+    Inverted index from informative tokens to the rows of the patterns that
+    contain them, used to prune the patterns an utterance is compared with.
+    """
+
+    __slots__ = ('postings',)
+
+    def __init__(self, patterns, max_share=MAX_TOKEN_SHARE):
+        postings = {}
+        for row, pattern in enumerate(patterns):
+            for token in set(tokenize(pattern)):
+                if token not in STOPWORDS:
+                    postings.setdefault(token, array('i')).append(row)
+
+        limit = max(max_share * len(patterns), MIN_TOKEN_LIMIT)
+        self.postings = {
+            token: rows for token, rows in postings.items() if len(rows) <= limit
+        }
+
+    def candidates(self, text_lower):
+        """
+        Sorted rows of every pattern sharing an informative token with text_lower.
+        """
+        rows = set()
+        for token in set(tokenize(text_lower)):
+            posting = self.postings.get(token)
+            if posting is not None:
+                rows.update(posting)
+        return sorted(rows)
+
+
+def topic_name(tag):
+    """
+    Speakable form of a tag, e.g. "order_status" -> "order status".
+    """
+    return tag.replace('_', ' ').replace('-', ' ')
+
+
+class TopicIndex:
+    """
+    Nearest-tag lookup for suggestions when nothing matched.
+
+    Every distinct tag gets one n-gram profile built from its name and the
+    patterns of its intents, so an utterance is ranked against tags with a
+    single sparse matrix-vector product instead of listing them all.
+    """
+
+    __slots__ = ('tags', 'similarity')
+
+    def __init__(self, tags, patterns, pattern_intents, first_position=0):
+        """
+        Args:
+            tags: Tags of the intents at first_position onwards
+            patterns: Lowercased patterns
+            pattern_intents: Position of the intent owning each pattern
+            first_position: Position of the first intent in tags
+        """
+        profiles = {}
+        for tag in tags:
+            if tag:
+                profiles.setdefault(tag, [topic_name(tag).lower()])
+        for pattern, position in zip(patterns, pattern_intents):
+            if position >= first_position:
+                tag = tags[position - first_position]
+                if tag:
+                    profiles[tag].append(pattern)
+
+        self.tags = tuple(profiles)
+        self.similarity = None
+        if self.tags and intent_similarity.is_available():
+            self.similarity = NgramSimilarity([' '.join(words) for words in profiles.values()])
+
+    def nearest(self, text_lower, k=SUGGESTION_COUNT):
+        """
+        Up to k (tag, score) pairs nearest to text_lower, best first. Without
+        NumPy/SciPy the first k tags are returned with a score of 0.
+        """
+        if self.similarity is None:
+            return [(tag, 0.0) for tag in self.tags[:k]]
+        return [(self.tags[row], score) for row, score in self.similarity.top_k(text_lower, k)]
+
+
+class _Compiled:
+    """
+    Tables of one full compile, plus the indexes built lazily over them.
+
+    Shared by every snapshot derived from the compile, so a lazily built
+    token index or similarity matrix is built once, not once per version.
+    """
+
+    __slots__ = (
+        'tags', 'responses', 'patterns', 'pattern_intents', 'automaton',
+        'tag_positions', 'tokens', 'similarity', 'topics', 'spelling'
+    )
+
+    def __init__(self, tags, responses, patterns, pattern_intents):
+        self.tags = tags
+        self.responses = responses
+        self.patterns = patterns
+        self.pattern_intents = pattern_intents
+        self.automaton = PatternAutomaton(zip(patterns, pattern_intents))
+        self.tag_positions = None
+        self.tokens = None
+        self.similarity = None
+        self.topics = None
+        self.spelling = None
+
+
+class _Delta:
+    """
+    Intents learned on top of a compile. Never modified once built.
+
+    Extending a delta copies only the delta, which journal compaction keeps
+    small, never the compiled tables.
+    """
+
+    __slots__ = ('patterns', 'tags', 'responses', 'tag_positions')
+
+    def __init__(self, patterns=(), tags=(), responses=None, tag_positions=None):
+        # (pattern, position) pairs checked with a plain scan
+        self.patterns = patterns
+        # Tags of intents that are not in the compile, in learned order
+        self.tags = tags
+        # Responses learned per intent position
+        self.responses = responses or {}
+        # Position of each learned tag
+        self.tag_positions = tag_positions or {}
+
+
+_EMPTY_DELTA = _Delta()
+
+
+def _scan_order(entries):
+    """
+    (pattern, position, floor) triples for a linear scan over (pattern,
+    position) entries, where floor is the lowest position among the entry
+    and every entry after it.
+    """
+    scan = []
+    floor = None
+    for pattern, position in reversed(entries):
+        floor = _min_priority(position, floor)
+        scan.append((pattern, position, floor))
+    scan.reverse()
+    return tuple(scan)
+
+
+class _LearnedTags:
+    """
+    Compiled tags followed by the tags of learned intents.
+    """
+
+    __slots__ = ('_base', '_learned')
+
+    def __init__(self, base, learned):
+        self._base = base
+        self._learned = learned
+
+    def __len__(self):
+        return len(self._base) + len(self._learned)
+
+    def __getitem__(self, position):
+        if position < len(self._base):
+            return self._base[position]
+        return self._learned[position - len(self._base)]
+
+    def __iter__(self):
+        yield from self._base
+        yield from self._learned
+
+
+class _LearnedResponses:
+    """
+    Compiled responses with the learned responses of each intent appended.
+    """
+
+    __slots__ = ('_base', '_count', '_learned')
+
+    def __init__(self, base, count, learned):
+        self._base = base
+        self._count = count
+        self._learned = learned
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, position):
+        learned = self._learned.get(position, ())
+        if position < len(self._base):
+            return self._base[position] + learned
+        return learned
+
+    def __iter__(self):
+        return (self[position] for position in range(self._count))
+
+
+class IntentIndex:
+    """
+    Compiled, deduplicated, immutable snapshot of an intents document.
+
+    Patterns are lowercased and deduplicated across the whole document (only
+    the first occurrence can ever win a first-match lookup), tags and
+    responses are kept in tuples, and the raw JSON is not retained.
+
+    A snapshot is never modified: with_learned() returns a new snapshot with
+    a higher version that shares the compiled tables with this one, so a
+    reader holding a snapshot sees the same intents for as long as it keeps
+    it, whatever writers publish in the meantime.
+    """
+
+    __slots__ = ('version', '_compiled', '_delta', '_learned_topics', '_learned_scan')
+
+    def __init__(self, tags, responses, patterns, pattern_intents):
+        """
+        Args:
+            tags: Tag of every intent, in file order
+            responses: Tuple of responses for every intent, in file order
+            patterns: Unique lowercased patterns, ordered by owning intent
+            pattern_intents: Position of the intent owning each pattern
+        """
+        self.version = next(_VERSIONS)
+        self._compiled = _Compiled(tags, responses, patterns, pattern_intents)
+        self._delta = _EMPTY_DELTA
+        self._learned_topics = None
+        self._learned_scan = ()
+
+    @classmethod
+    def from_document(cls, intents):
+        """
+        Compile an {"intents": [...]} document as loaded from intents.json.
+        """
+        tags = []
+        responses = []
+        patterns = {}
+        for position, intent in enumerate(intents['intents']):
+            tags.append(sys.intern(intent.get('tag') or ''))
+            responses.append(tuple(sys.intern(response) for response in intent['responses']))
+            for pattern in intent['patterns']:
+                patterns.setdefault(sys.intern(pattern.lower()), position)
+
+        return cls(
+            tuple(tags),
+            tuple(responses),
+            tuple(patterns),
+            tuple(patterns.values())
+        )
+
+    def __len__(self):
+        return len(self._compiled.tags) + len(self._delta.tags)
+
+    @property
+    def tags(self):
+        if not self._delta.tags:
+            return self._compiled.tags
+        return _LearnedTags(self._compiled.tags, self._delta.tags)
+
+    @property
+    def responses(self):
+        if not self._delta.responses:
+            return self._compiled.responses
+        return _LearnedResponses(self._compiled.responses, len(self), self._delta.responses)
+
+    @property
+    def patterns(self):
+        return self._compiled.patterns
+
+    @property
+    def pattern_intents(self):
+        return self._compiled.pattern_intents
+
+    @property
+    def automaton(self):
+        return self._compiled.automaton
+
+    @property
+    def learned(self):
+        """
+        (pattern, position) pairs learned since the last full compile.
+        """
+        return self._delta.patterns
+
+    @property
+    def tag_positions(self):
+        """
+        Position of the first compiled intent carrying each tag.
+        """
+        compiled = self._compiled
+        if compiled.tag_positions is None:
+            positions = {}
+            for position, tag in enumerate(compiled.tags):
+                positions.setdefault(tag, position)
+            compiled.tag_positions = positions
+        return compiled.tag_positions
+
+    def position_of(self, tag):
+        """
+        Position of the first intent carrying tag, or None.
+        """
+        position = self.tag_positions.get(tag)
+        if position is None:
+            position = self._delta.tag_positions.get(tag)
+        return position
+
+    def with_learned(self, tag, pattern, response):
+        """
+        New snapshot with a learned pattern and response applied on top of this one.
+
+        The compiled automaton, token index and similarity matrix are shared
+        with this snapshot and only the learned delta is extended, so the
+        cost does not depend on the corpus size. The learned pattern is
+        checked with a plain scan until the next full compile folds it in.
+        """
+        delta = self._delta
+        tags = delta.tags
+        responses = delta.responses
+        tag_positions = delta.tag_positions
+
+        position = self.position_of(tag)
+        if position is None:
+            position = len(self)
+            tags = tags + (sys.intern(tag),)
+            tag_positions = dict(tag_positions)
+            tag_positions[tag] = position
+            responses = dict(responses)
+            responses[position] = (response,)
+        elif response not in self.responses[position]:
+            responses = dict(responses)
+            responses[position] = responses.get(position, ()) + (response,)
+
+        index = IntentIndex.__new__(IntentIndex)
+        index.version = next(_VERSIONS)
+        index._compiled = self._compiled
+        index._delta = _Delta(
+            delta.patterns + ((sys.intern(pattern.lower()), position),),
+            tags,
+            responses,
+            tag_positions
+        )
+        index._learned_topics = None
+        index._learned_scan = _scan_order(index._delta.patterns)
+        return index
+
+    def reorder(self, hit_counts):
+        """
+        Scan learned patterns in order of how often their intent was hit,
+        most frequent first.
+
+        Results do not change: every pattern keeps its intent position as an
+        explicit priority, and a scan stops once no remaining pattern can
+        beat the best match so far. Only the evaluation order is replaced,
+        with a single reference swap, so concurrent readers are unaffected.
+
+        Args:
+            hit_counts: Mapping from tag to number of hits
+        """
+        tags = self.tags
+        learned = self.learned
+        ranked = sorted(
+            range(len(learned)),
+            key=lambda i: (-hit_counts.get(tags[learned[i][1]], 0), i)
+        )
+        self._learned_scan = _scan_order([learned[i] for i in ranked])
+
+    def match(self, text_lower):
+        """
+        Position of the first intent with a pattern contained in text_lower.
+        """
+        best = self.automaton.first_match(text_lower)
+        for pattern, position, floor in self._learned_scan:
+            if best is not None and best <= floor:
+                break
+            if (best is None or position < best) and pattern in text_lower:
+                best = position
+        return best
+
+    def match_containing(self, text_lower, rows=None):
+        """
+        Position of the first intent with a pattern that contains text_lower,
+        optionally looking only at the given pattern rows.
+        """
+        patterns = self.patterns
+        if rows is None:
+            rows = range(len(patterns))
+        best = None
+        for row in rows:
+            if text_lower in patterns[row]:
+                best = self.pattern_intents[row]
+                break
+        for pattern, position, floor in self._learned_scan:
+            if best is not None and best <= floor:
+                break
+            if (best is None or position < best) and text_lower in pattern:
+                best = position
+        return best
+
+    @property
+    def tokens(self):
+        """
+        Token inverted index over the patterns, built on first use.
+        """
+        compiled = self._compiled
+        if compiled.tokens is None:
+            compiled.tokens = TokenIndex(compiled.patterns)
+        return compiled.tokens
+
+    @property
+    def similarity(self):
+        """
+        Character n-gram similarity matrix over the patterns, built on first
+        use. None when NumPy/SciPy are not installed.
+        """
+        compiled = self._compiled
+        if compiled.similarity is None and intent_similarity.is_available():
+            compiled.similarity = NgramSimilarity(compiled.patterns)
+        return compiled.similarity
+
+    @property
+    def topics(self):
+        """
+        TopicIndex over the compiled tags, built on first use.
+        """
+        compiled = self._compiled
+        if compiled.topics is None:
+            compiled.topics = TopicIndex(compiled.tags, compiled.patterns, compiled.pattern_intents)
+        return compiled.topics
+
+    def suggest_topics(self, text_lower, k=SUGGESTION_COUNT):
+        """
+        Up to k tags nearest to text_lower, best first.
+
+        Tags learned since the last compile are ranked by a small TopicIndex
+        of their own, built once per snapshot version, and merged in.
+        """
+        suggestions = self.topics.nearest(text_lower, k)
+        delta = self._delta
+        if delta.tags:
+            if self._learned_topics is None:
+                learned = tuple(zip(*delta.patterns)) or ((), ())
+                self._learned_topics = TopicIndex(delta.tags, learned[0], learned[1],
+                                                  len(self._compiled.tags))
+            suggestions = sorted(suggestions + self._learned_topics.nearest(text_lower, k),
+                                 key=lambda suggestion: -suggestion[1])
+        return [tag for tag, _ in suggestions[:k]]
+
+    @property
+    def spelling(self):
+        """
+        SpellingIndex over the words of the compiled patterns, built on first use.
+        """
+        compiled = self._compiled
+        if compiled.spelling is None:
+            compiled.spelling = SpellingIndex(
+                token for pattern in compiled.patterns for token in tokenize(pattern)
+            )
+        return compiled.spelling
+
+    def candidate_rows(self, text_lower):
+        """
+        Pattern rows the similarity pass should score for text_lower.
+
+        Returns the rows sharing an informative token with text_lower. If
+        there are none, returns None (score every pattern) while the corpus is
+        within FULL_SCAN_LIMIT, and an empty list (score nothing) beyond it.
+        """
+        rows = self.tokens.candidates(text_lower)
+        if not rows and len(self.patterns) <= FULL_SCAN_LIMIT:
+            return None
+        return rows
+
+    def match_similar(self, text_lower, threshold=SIMILARITY_THRESHOLD):
+        """
+        Position and score of the intent owning the pattern most similar to
+        text_lower, or (None, score) if nothing reaches threshold.
+
+        Only the candidate_rows() of text_lower are scored, so the cost
+        follows the candidate set rather than the corpus. Without NumPy/SciPy
+        this falls back to substring containment.
+        """
+        rows = self.candidate_rows(text_lower)
+        if rows is not None and not rows:
+            return None, 0.0
+
+        similarity = self.similarity
+        if similarity is None:
+            position = self.match_containing(text_lower, rows)
+            return position, 0.0 if position is None else 1.0
+
+        row, score = similarity.best(text_lower, threshold, rows)
+        if row is None:
+            return None, score
+        return self.pattern_intents[row], score
+
+    def match_corrected(self, text_lower, threshold=SIMILARITY_THRESHOLD):
+        """
+        Exact, then similar match of text_lower after correcting words that
+        are within a small edit distance of a pattern word, as speech
+        recognition often gets one letter wrong. Returns (None, 0.0) when
+        there was nothing to correct.
+        """
+        corrected = self.spelling.correct(text_lower)
+        if corrected == text_lower:
+            return None, 0.0
+        position = self.match(corrected)
+        if position is not None:
+            return position, 1.0
+        return self.match_similar(corrected, threshold)
+
+    def resolve(self, text_lower, threshold=SIMILARITY_THRESHOLD, fuzzy=True):
+        """
+        Side-effect free lookup: exact pattern match first (score 1.0), then
+        the most similar pattern, then (with fuzzy) both again on the
+        spelling-corrected text. Returns (position, score), with position
+        None on a miss.
+        """
+        position = self.match(text_lower)
+        if position is not None:
+            return position, 1.0
+        position, score = self.match_similar(text_lower, threshold)
+        if position is None and fuzzy:
+            corrected = self.match_corrected(text_lower, threshold)
+            if corrected[0] is not None:
+                return corrected
+        return position, score
+
+    def resolve_batch(self, texts_lower, threshold=SIMILARITY_THRESHOLD, fuzzy=True):
+        """
+        resolve() for a list of texts. Texts the automaton misses are scored
+        together with one sparse matrix product.
+        """
+        results = [None] * len(texts_lower)
+        misses = []
+        for i, text_lower in enumerate(texts_lower):
+            position = self.match(text_lower)
+            if position is not None:
+                results[i] = (position, 1.0)
+            else:
+                misses.append(i)
+
+        similarity = self.similarity
+        if similarity is None:
+            for i in misses:
+                results[i] = self.match_similar(texts_lower[i], threshold)
+        else:
+            texts = [texts_lower[i] for i in misses]
+            candidates = [self.candidate_rows(text_lower) for text_lower in texts]
+            for i, (row, score) in zip(misses, similarity.best_batch(texts, threshold, candidates)):
+                results[i] = (None if row is None else self.pattern_intents[row], score)
+
+        if fuzzy:
+            for i in misses:
+                if results[i][0] is None:
+                    corrected = self.match_corrected(texts_lower[i], threshold)
+                    if corrected[0] is not None:
+                        results[i] = corrected
+        return results
+
+    def choose_response(self, position):
+        """
+        Pick a random response for the intent at position.
+        """
+        return random.choice(self.responses[position])
+
+
+def get_intent_index(intents):
+    """
+    Return an IntentIndex for intents, compiling raw documents once.
+
+    IntentIndex instances are returned unchanged. Raw documents are cached by
+    object and revalidated against the number of patterns per intent, so
+    intents learned at runtime (which append to the pattern lists in place)
+    trigger a rebuild.
+    """
+    if isinstance(intents, IntentIndex):
+        return intents
+
+    signature = tuple(len(intent['patterns']) for intent in intents['intents'])
+    cached = _INDEX_CACHE.get(id(intents))
+    if cached is not None and cached[0] is intents and cached[1] == signature:
+        return cached[2]
+
+    index = IntentIndex.from_document(intents)
+    if len(_INDEX_CACHE) >= _INDEX_CACHE_SIZE:
+        _INDEX_CACHE.clear()
+    _INDEX_CACHE[id(intents)] = (intents, signature, index)
+    return index
+
+
+def match_batch(utterances, intents, threshold=SIMILARITY_THRESHOLD, workers=None,
+                chunk_size=BATCH_CHUNK_SIZE):
+    """
+    Resolve many utterances against intents without any speech side effects.
+
+    Args:
+        utterances: List or iterator of utterances
+        intents: IntentIndex or raw intents document
+        threshold: Minimum similarity for the second pass
+        workers: Number of worker processes; None or 0 resolves in-process
+        chunk_size: Utterances scored per vectorized call
+
+    Returns:
+        list: (tag, score) per utterance, with tag None on a miss
+    """
+    index = get_intent_index(intents)
+    chunks = _chunked((text.lower() for text in utterances), chunk_size)
+
+    if workers:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                 initargs=(index, threshold)) as pool:
+            chunk_results = list(pool.map(_resolve_in_batch_worker, chunks))
+    else:
+        chunk_results = (index.resolve_batch(chunk, threshold) for chunk in chunks)
+
+    results = []
+    for chunk in chunk_results:
+        results.extend(
+            (None if position is None else index.tags[position], score)
+            for position, score in chunk
+        )
+    return results
+
+
+def _chunked(iterable, size):
+    """
+    Yield lists of up to size items from iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _init_batch_worker(index, threshold):
+    global _BATCH_WORKER
+    _BATCH_WORKER = (index, threshold)
+
+
+def _resolve_in_batch_worker(chunk):
+    index, threshold = _BATCH_WORKER
+    return index.resolve_batch(chunk, threshold)
+
+
+def load_intents_csv(path='intents.csv'):
+    """
+    Load a tag,pattern,response CSV (as written by csvGenerator.py) into the
+    same {"intents": [...]} shape as intents.json.
+
+    The CSV repeats every pattern once per response, so patterns and
+    responses are deduplicated per tag while keeping their first-seen order.
+    """
+    intents = {}
+    with open(path, 'r', newline='', encoding='utf-8') as csvfile:
+        for row in csv.DictReader(csvfile):
+            intent = intents.setdefault(row['tag'], {
+                "tag": row['tag'],
+                "patterns": {},
+                "responses": {}
+            })
+            intent['patterns'].setdefault(row['pattern'], None)
+            intent['responses'].setdefault(row['response'], None)
+
+    return {
+        "intents": [
+            {
+                "tag": intent['tag'],
+                "patterns": list(intent['patterns']),
+                "responses": list(intent['responses'])
+            }
+            for intent in intents.values()
+        ]
+    }
+
+
+def load_intent_document(path):
+    """
+    Load intents from a .json document or a tag,pattern,response .csv file.
+    """
+    if path.endswith('.csv'):
+        return load_intents_csv(path)
+    with open(path, 'r') as file:
+        return json.load(file)
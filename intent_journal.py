@@ -0,0 +1,214 @@
+import json
+import os
+import threading
+
+from intent_store import DEFAULT_STORE_PATH, build_store, is_store_current
+
+DEFAULT_JOURNAL_PATH = 'intents.journal'
+DEFAULT_BASE_PATH = 'intents.json'
+
+# Group commit: fsync once this many entries are pending...
+FSYNC_BATCH = 16
+# ...or this many seconds after the first pending entry, whichever is first
+FSYNC_INTERVAL = 1.0
+# Fold the journal into the base file once it holds this many entries
+COMPACT_THRESHOLD = 256
+
+# One journal per path, shared by every module in the process
+_JOURNALS = {}
+_JOURNALS_LOCK = threading.Lock()
+
+
+def apply_entry(intents, entry):
+    """
+    Apply a journal entry to an {"intents": [...]} document in place.
+
+    Re-applying an entry is a no-op, so replaying a journal that was already
+    partly folded into the base file is safe.
+    """
+    for intent in intents['intents']:
+        if intent['tag'] == entry['tag']:
+            if entry['pattern'] not in intent['patterns']:
+                intent['patterns'].append(entry['pattern'])
+            if entry['response'] not in intent['responses']:
+                intent['responses'].append(entry['response'])
+            return
+
+    intents['intents'].append({
+        "tag": entry['tag'],
+        "patterns": [entry['pattern']],
+        "responses": [entry['response']]
+    })
+
+
+def read_entries(path=DEFAULT_JOURNAL_PATH):
+    """
+    Entries recorded in the journal at path, oldest first.
+
+    A torn last line left by a crash mid-write is ignored.
+    """
+    entries = []
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def replay(index, path=DEFAULT_JOURNAL_PATH):
+    """
+    Apply every journal entry to an IntentIndex and return the result.
+    """
+    for entry in read_entries(path):
+        index = index.with_learned(entry['tag'], entry['pattern'], entry['response'])
+    return index
+
+
+class IntentJournal:
+    """
+    Append-only journal of learned intents.
+
+    Appends cost one short write regardless of corpus size and are fsync'd in
+    groups. compact() folds the journal into the base intents file through a
+    temp file and an atomic rename, so a crash at any point leaves either the
+    old or the new intents.json on disk, never a partial one. A compiled
+    store that was current for the base file is rebuilt with it, so loading
+    keeps the memory-mapped path.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH, base_path=DEFAULT_BASE_PATH,
+                 fsync_batch=FSYNC_BATCH, fsync_interval=FSYNC_INTERVAL,
+                 store_path=DEFAULT_STORE_PATH):
+        self.path = path
+        self.base_path = base_path
+        self.store_path = store_path
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        _drop_torn_tail(path)
+        self._file = open(path, 'a', encoding='utf-8')
+        self._pending = 0
+        self._timer = None
+        self.entries = len(read_entries(path))
+
+    def append(self, tag, pattern, response):
+        """
+        Record a learned pattern and response for tag.
+        """
+        line = json.dumps({"tag": tag, "pattern": pattern, "response": response}) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self.entries += 1
+            self._pending += 1
+            if self._pending >= self.fsync_batch:
+                self._sync_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.fsync_interval, self.sync)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def sync(self):
+        """
+        fsync every pending entry.
+        """
+        with self._lock:
+            self._sync_locked()
+
+    def _sync_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending:
+            os.fsync(self._file.fileno())
+            self._pending = 0
+
+    def needs_compaction(self, threshold=COMPACT_THRESHOLD):
+        """
+        True once the journal holds threshold entries or more.
+        """
+        return self.entries >= threshold
+
+    def compact(self):
+        """
+        Fold the journal into the base intents file and truncate it, and
+        rebuild the compiled store if it was built from the base file.
+
+        Returns the compacted intents document.
+        """
+        with self._lock:
+            self._sync_locked()
+            rebuild_store = is_store_current(self.store_path, self.base_path)
+            with open(self.base_path, 'r') as file:
+                intents = json.load(file)
+            for entry in read_entries(self.path):
+                apply_entry(intents, entry)
+
+            temp_path = f"{self.base_path}.tmp"
+            with open(temp_path, 'w') as file:
+                json.dump(intents, file, indent=4)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, self.base_path)
+            _fsync_directory(self.base_path)
+            if rebuild_store:
+                # A stale store is only skipped, so a crash before this
+                # point costs the mmap path, never correctness
+                build_store(intents, self.store_path, source_path=self.base_path)
+
+            # Only drop entries once the base file containing them is durable
+            self._file.truncate(0)
+            os.fsync(self._file.fileno())
+            self.entries = 0
+            return intents
+
+    def close(self):
+        with self._lock:
+            self._sync_locked()
+            self._file.close()
+
+
+def _drop_torn_tail(path):
+    """
+    Cut a partial last line left by a crash, so new entries start on a line
+    of their own.
+    """
+    try:
+        with open(path, 'rb+') as file:
+            data = file.read()
+            if data and not data.endswith(b"\n"):
+                file.truncate(data.rfind(b"\n") + 1)
+    except FileNotFoundError:
+        pass
+
+
+def _fsync_directory(path):
+    """
+    Make a rename inside path's directory durable (not supported on Windows).
+    """
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def open_journal(path=DEFAULT_JOURNAL_PATH, base_path=DEFAULT_BASE_PATH):
+    """
+    Shared IntentJournal for path, opened on first use.
+    """
+    with _JOURNALS_LOCK:
+        journal = _JOURNALS.get(path)
+        if journal is None:
+            journal = _JOURNALS[path] = IntentJournal(path, base_path)
+        return journal
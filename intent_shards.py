@@ -0,0 +1,358 @@
+import argparse
+import heapq
+import multiprocessing
+import os
+import queue
+import secrets
+import threading
+from multiprocessing.connection import Client, Listener
+
+from intent_index import IntentIndex, load_intent_document
+from intent_journal import DEFAULT_JOURNAL_PATH, apply_entry, read_entries
+from intent_similarity import SIMILARITY_THRESHOLD
+
+# Shared secret for the shard connections; every shard server and the
+# front-end must use the same one
+AUTHKEY_VARIABLE = 'INTENT_SHARD_KEY'
+# Either a number of local shard processes or comma-separated host:port
+# addresses of shard servers
+SHARDS_VARIABLE = 'INTENT_SHARDS'
+# Intents the local shards load (.json or .csv)
+SOURCE_VARIABLE = 'INTENT_SHARDS_SOURCE'
+DEFAULT_TOP_K = 5
+# Idle connection sets (one connection per shard) kept for reuse
+DEFAULT_POOL_SIZE = 16
+# Pending connections a shard server queues; multiprocessing's default of 1
+# stalls bursts of new connections in the handshake
+LISTEN_BACKLOG = 128
+
+# Result kinds, in the order they win when merging shard results
+EXACT, SIMILAR, CORRECTED = 0, 1, 2
+
+
+def load_shard(intents_path, shard, num_shards, journal_path=DEFAULT_JOURNAL_PATH):
+    """
+    Compile the intents owned by one shard.
+
+    Intents are dealt out round-robin by file position, after the journal
+    has been applied, so every shard holds about 1/num_shards of the corpus.
+
+    Returns:
+        (IntentIndex, global position of each local intent)
+    """
+    intents = load_intent_document(intents_path)
+    if journal_path:
+        for entry in read_entries(journal_path):
+            apply_entry(intents, entry)
+
+    owned = intents['intents'][shard::num_shards]
+    positions = list(range(shard, len(intents['intents']), num_shards))
+    return IntentIndex.from_document({"intents": owned}), positions
+
+
+class ShardServer:
+    """
+    Serves one shard of the intents over multiprocessing.connection.
+
+    Requests and replies are small tuples of strings and numbers, so the
+    same server runs as a local process or on another node. Connections
+    are authenticated with a shared key; only expose shards on a trusted
+    network.
+    """
+
+    def __init__(self, intents_path, shard, num_shards, journal_path=DEFAULT_JOURNAL_PATH):
+        self.intents_path = intents_path
+        self.shard = shard
+        self.num_shards = num_shards
+        self.journal_path = journal_path
+        self.index, self.positions = load_shard(intents_path, shard, num_shards, journal_path)
+
+    def reload(self):
+        """
+        Recompile the shard from disk and swap it in.
+        """
+        index, positions = load_shard(self.intents_path, self.shard, self.num_shards, self.journal_path)
+        self.index, self.positions = index, positions
+        return len(index)
+
+    def resolve(self, text_lower, threshold):
+        """
+        (kind, global position, score, tag, responses) of the best local
+        match, or None.
+        """
+        index, positions = self.index, self.positions
+        position = index.match(text_lower)
+        kind = EXACT
+        score = 1.0
+        if position is None:
+            kind = SIMILAR
+            position, score = index.match_similar(text_lower, threshold)
+        if position is None:
+            kind = CORRECTED
+            position, score = index.match_corrected(text_lower, threshold)
+        if position is None:
+            return None
+        return kind, positions[position], score, index.tags[position], tuple(index.responses[position])
+
+    def top_k(self, text_lower, k):
+        """
+        Up to k (score, global position, tag) of the local intents most
+        similar to text_lower, best first.
+        """
+        index, positions = self.index, self.positions
+        similarity = index.similarity
+        if similarity is None:
+            return []
+        results = []
+        seen = set()
+        # A strong intent usually owns several of the top rows
+        for row, score in similarity.top_k(text_lower, k * 4):
+            position = index.pattern_intents[row]
+            if position not in seen:
+                seen.add(position)
+                results.append((score, positions[position], index.tags[position]))
+                if len(results) == k:
+                    break
+        return results
+
+    def handle(self, request):
+        command, *args = request
+        if command == 'resolve':
+            return self.resolve(*args)
+        if command == 'top_k':
+            return self.top_k(*args)
+        if command == 'reload':
+            return self.reload()
+        if command == 'stats':
+            return {"shard": self.shard, "intents": len(self.index), "patterns": len(self.index.patterns)}
+        raise ValueError(f"Unknown shard command: {command}")
+
+    def serve(self, listener):
+        """
+        Accept connections until the process exits, one thread per connection.
+        """
+        while True:
+            connection = listener.accept()
+            threading.Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+
+    def _serve_connection(self, connection):
+        with connection:
+            while True:
+                try:
+                    request = connection.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = ('ok', self.handle(request))
+                except Exception as e:
+                    reply = ('error', str(e))
+                connection.send(reply)
+
+
+def _run_local_shard(intents_path, shard, num_shards, authkey, ready):
+    listener = Listener(('127.0.0.1', 0), backlog=LISTEN_BACKLOG, authkey=authkey)
+    server = ShardServer(intents_path, shard, num_shards)
+    ready.send(listener.address)
+    ready.close()
+    server.serve(listener)
+
+
+class ShardedIntents:
+    """
+    Scatter-gather front-end over shard servers.
+
+    Every request is sent to all shards at once and their answers are
+    merged: exact matches beat similar ones, which beat spelling-corrected
+    ones, then the higher score and finally the earlier intent wins. That is
+    what a single IntentIndex over the whole corpus answers, except that
+    spelling correction only knows the words of its own shard.
+
+    A request checks out a set of connections, one per shard, from a shared
+    pool and returns it afterwards, so concurrent requests never wait on
+    each other here and a server starting a thread per request still
+    reuses the connections instead of opening new ones.
+
+    version counts the reload() calls, so an IntentCache can be bound to the
+    shards like to an IntentIndex snapshot.
+    """
+
+    def __init__(self, addresses, authkey, processes=(), pool_size=DEFAULT_POOL_SIZE, source=None):
+        """
+        Args:
+            addresses: (host, port) of every shard server
+            authkey: Shared key the shard servers were started with
+            processes: Local shard processes to stop on close()
+            pool_size: Most idle connection sets kept for reuse
+            source: Intents file the shards load, or None if unknown
+        """
+        self.addresses = list(addresses)
+        self.authkey = authkey
+        self.processes = list(processes)
+        self.source = source
+        self.version = 0
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+
+    @classmethod
+    def start_local(cls, intents_path, num_shards):
+        """
+        Start num_shards shard processes on this machine and connect to them.
+        """
+        authkey = secrets.token_bytes(32)
+        processes = []
+        addresses = []
+        for shard in range(num_shards):
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=_run_local_shard,
+                args=(intents_path, shard, num_shards, authkey, sender),
+                name=f"intent-shard-{shard}",
+                daemon=True
+            )
+            process.start()
+            sender.close()
+            processes.append((process, receiver))
+        for process, receiver in processes:
+            addresses.append(receiver.recv())
+            receiver.close()
+        return cls(addresses, authkey, [process for process, _ in processes], source=intents_path)
+
+    def _connect(self):
+        return [Client(address, authkey=self.authkey) for address in self.addresses]
+
+    def _checkout(self):
+        """
+        (idle connection set or a new one, whether it came from the pool)
+        """
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._connect(), False
+
+    def _checkin(self, connections):
+        try:
+            self._idle.put_nowait(connections)
+        except queue.Full:
+            _close_all(connections)
+
+    def _scatter(self, request):
+        """
+        Send request to every shard and return their replies in shard order.
+        """
+        connections, pooled = self._checkout()
+        while True:
+            try:
+                for connection in connections:
+                    connection.send(request)
+                replies = [connection.recv() for connection in connections]
+                break
+            except (EOFError, OSError):
+                # Never reuse a broken socket. An idle set may have gone
+                # stale (e.g. a shard restarted), so retry once on a new one
+                _close_all(connections)
+                if not pooled:
+                    raise
+                connections, pooled = self._connect(), False
+            except BaseException:
+                # A reply may still be in flight on these connections
+                _close_all(connections)
+                raise
+        self._checkin(connections)
+        for status, value in replies:
+            if status != 'ok':
+                raise RuntimeError(f"Shard error: {value}")
+        return [value for _, value in replies]
+
+    def resolve(self, text_lower, threshold=SIMILARITY_THRESHOLD):
+        """
+        (tag, responses, score) of the best match across all shards, or None.
+        """
+        results = [result for result in self._scatter(('resolve', text_lower, threshold)) if result]
+        if not results:
+            return None
+        _, _, score, tag, responses = min(results, key=lambda result: (result[0], -result[2], result[1]))
+        return tag, responses, score
+
+    def top_k(self, text_lower, k=DEFAULT_TOP_K):
+        """
+        Up to k (tag, score) most similar to text_lower across all shards.
+        """
+        merged = heapq.merge(*self._scatter(('top_k', text_lower, k)),
+                             key=lambda result: (-result[0], result[1]))
+        return [(tag, score) for score, _, tag in list(merged)[:k]]
+
+    def reload(self):
+        """
+        Make every shard recompile its intents from disk.
+        """
+        reloaded = sum(self._scatter(('reload',)))
+        self.version += 1
+        return reloaded
+
+    def stats(self):
+        return self._scatter(('stats',))
+
+    def close(self):
+        while True:
+            try:
+                _close_all(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        for process in self.processes:
+            process.terminate()
+
+
+def _close_all(connections):
+    for connection in connections:
+        try:
+            connection.close()
+        except OSError:
+            pass
+
+
+def connect_from_environment(intents_path='intents.json'):
+    """
+    ShardedIntents configured by INTENT_SHARDS, or None when it is unset.
+
+    INTENT_SHARDS=4 starts four local shard processes over intents_path
+    (or INTENT_SHARDS_SOURCE); INTENT_SHARDS=host1:6000,host2:6000 connects
+    to running shard servers using the key in INTENT_SHARD_KEY.
+    """
+    shards = os.environ.get(SHARDS_VARIABLE, '').strip()
+    if not shards:
+        return None
+    if shards.isdigit():
+        return ShardedIntents.start_local(os.environ.get(SOURCE_VARIABLE, intents_path), int(shards))
+
+    addresses = []
+    for address in shards.split(','):
+        host, port = address.strip().rsplit(':', 1)
+        addresses.append((host, int(port)))
+    return ShardedIntents(addresses, os.environ[AUTHKEY_VARIABLE].encode('utf-8'))
+
+
+def main():
+    """
+    Serve one shard of the intents, for matching across nodes.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--intents', default='intents.json',
+                        help="intents to shard (.json or .csv)")
+    parser.add_argument('--shard', type=int, required=True, help="index of this shard")
+    parser.add_argument('--shards', type=int, required=True, help="total number of shards")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6000)
+    args = parser.parse_args()
+
+    authkey = os.environ.get(AUTHKEY_VARIABLE)
+    if not authkey:
+        parser.error(f"set {AUTHKEY_VARIABLE} to the key shared with the front-end")
+
+    server = ShardServer(args.intents, args.shard, args.shards)
+    listener = Listener((args.host, args.port), backlog=LISTEN_BACKLOG, authkey=authkey.encode('utf-8'))
+    print(f"Shard {args.shard}/{args.shards}: {len(server.index)} intents, "
+          f"{len(server.index.patterns)} patterns on {args.host}:{args.port}")
+    server.serve(listener)
+
+
+if __name__ == "__main__":
+    main()
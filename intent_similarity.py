@@ -0,0 +1,197 @@
+import zlib
+
+# Vectorized similarity needs NumPy and SciPy; matching falls back to plain
+# substring checks without them
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = None
+    sparse = None
+
+NGRAM_SIZE = 3
+NUM_FEATURES = 2 ** 18
+SIMILARITY_THRESHOLD = 0.6
+
+
+def is_available():
+    """
+    True when NumPy and SciPy are installed.
+    """
+    return np is not None and sparse is not None
+
+
+def char_ngrams(text, ngram_size=NGRAM_SIZE):
+    """
+    Character n-grams of text, padded with a space on both sides so word
+    boundaries contribute their own n-grams.
+    """
+    padded = f" {text} "
+    if len(padded) <= ngram_size:
+        return [padded]
+    return [padded[i:i + ngram_size] for i in range(len(padded) - ngram_size + 1)]
+
+
+def hash_ngram(ngram, num_features=NUM_FEATURES):
+    """
+    Stable feature id for an n-gram (unlike hash(), identical across processes).
+    """
+    return zlib.crc32(ngram.encode('utf-8')) % num_features
+
+
+class NgramSimilarity:
+    """
+    Cosine similarity between an utterance and every pattern over hashed
+    character n-grams.
+
+    Patterns are stored as the rows of an L2-normalized sparse matrix, so
+    scoring an utterance against the whole corpus is one sparse
+    matrix-vector product.
+    """
+
+    def __init__(self, patterns, ngram_size=NGRAM_SIZE, num_features=NUM_FEATURES):
+        """
+        Args:
+            patterns: Lowercased patterns; row i of the matrix is patterns[i]
+            ngram_size: Length of the character n-grams
+            num_features: Size of the hashed feature space
+        """
+        self.ngram_size = ngram_size
+        self.num_features = num_features
+
+        rows = []
+        cols = []
+        for row, pattern in enumerate(patterns):
+            for ngram in char_ngrams(pattern, ngram_size):
+                rows.append(row)
+                cols.append(hash_ngram(ngram, num_features))
+
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(patterns), num_features)
+        )
+        matrix.sum_duplicates()
+        self.matrix = _normalize_rows(matrix)
+
+    def vectorize(self, texts):
+        """
+        L2-normalized sparse matrix with one row per text.
+        """
+        rows = []
+        cols = []
+        for row, text in enumerate(texts):
+            for ngram in char_ngrams(text, self.ngram_size):
+                rows.append(row)
+                cols.append(hash_ngram(ngram, self.num_features))
+
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(texts), self.num_features)
+        )
+        matrix.sum_duplicates()
+        return _normalize_rows(matrix)
+
+    def query_vector(self, text):
+        """
+        L2-normalized dense feature vector for a single text.
+        """
+        cols = [hash_ngram(ngram, self.num_features) for ngram in char_ngrams(text, self.ngram_size)]
+        features, counts = np.unique(cols, return_counts=True)
+        query = np.zeros(self.num_features, dtype=np.float32)
+        query[features] = counts / np.sqrt(np.dot(counts, counts))
+        return query
+
+    def scores(self, text, rows=None):
+        """
+        Similarity of text to every pattern (or only to the given rows) as a
+        dense 1-D array.
+        """
+        query = self.query_vector(text)
+        if rows is None:
+            return self.matrix @ query
+        # Slicing rows out of the CSR matrix only pays off for small candidate sets
+        if len(rows) * 4 > self.matrix.shape[0]:
+            return (self.matrix @ query)[rows]
+        return self.matrix[rows] @ query
+
+    def best(self, text, threshold=SIMILARITY_THRESHOLD, rows=None):
+        """
+        Row and score of the most similar pattern, or (None, score) when the
+        best score is below threshold. Ties go to the lowest row.
+
+        Args:
+            text: Lowercased utterance
+            threshold: Minimum cosine similarity to accept
+            rows: Optional sorted candidate rows to restrict scoring to
+        """
+        if rows is None:
+            rows = range(self.matrix.shape[0])
+        if len(rows) == 0:
+            return None, 0.0
+        scores = self.scores(text, None if len(rows) == self.matrix.shape[0] else rows)
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        if score < threshold:
+            return None, score
+        return rows[best], score
+
+    def top_k(self, text, k):
+        """
+        Rows and scores of the k most similar patterns, best first. Rows
+        with no n-gram in common with text are left out.
+        """
+        scores = self.scores(text)
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((top, -scores[top]))]
+        return [(int(row), float(scores[row])) for row in top if scores[row] > 0]
+
+    def best_batch(self, texts, threshold=SIMILARITY_THRESHOLD, candidates=None):
+        """
+        best() for many texts at once: a single sparse matrix product scores
+        every text against every pattern.
+
+        Args:
+            texts: Lowercased utterances
+            threshold: Minimum cosine similarity to accept
+            candidates: Optional per-text sorted candidate rows (None for all rows)
+
+        Returns:
+            list: (row, score) per text, row None below threshold
+        """
+        if not texts:
+            return []
+        scores = (self.vectorize(texts) @ self.matrix.T).tocsr()
+
+        results = []
+        for i in range(len(texts)):
+            start, end = scores.indptr[i], scores.indptr[i + 1]
+            cols = scores.indices[start:end]
+            values = scores.data[start:end]
+            rows = None if candidates is None else candidates[i]
+            if rows is not None:
+                keep = np.isin(cols, rows)
+                cols = cols[keep]
+                values = values[keep]
+
+            if len(values) == 0:
+                results.append((None, 0.0))
+                continue
+            top = values.max()
+            score = float(top)
+            if score < threshold:
+                results.append((None, score))
+            else:
+                results.append((int(cols[values == top].min()), score))
+        return results
+
+
+def _normalize_rows(matrix):
+    """
+    Scale every row of a CSR matrix to unit L2 norm (empty rows stay empty).
+    """
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return (sparse.diags(1.0 / norms).astype(np.float32) @ matrix).tocsr()
@@ -0,0 +1,121 @@
+import itertools
+import threading
+import time
+import weakref
+from collections import Counter
+
+REORDER_INTERVAL = 60.0  # seconds between frequency reorders of the matcher
+TOP_INTENTS = 20
+
+
+class _Owner:
+    """
+    Held only by a thread's local storage, so it is collected when the
+    thread ends.
+    """
+
+    __slots__ = ('__weakref__',)
+
+
+class IntentStats:
+    """
+    Hit, miss and generation-fallback counters for the matching path.
+
+    Every thread increments plain counters of its own, so recording never
+    takes a lock or contends with other requests. The lock is only taken
+    the first time a thread records something, when the totals are read and
+    when a thread ends: its counters are then folded into the retired
+    totals, so a server starting a thread per request keeps one set of
+    counters per live thread.
+    """
+
+    def __init__(self, reorder_interval=REORDER_INTERVAL):
+        self.reorder_interval = reorder_interval
+        self.started = time.time()
+        self._local = threading.local()
+        self._shards = {}  # shard id -> counters of a live thread
+        self._shard_ids = itertools.count()
+        self._retired = (Counter(), Counter())
+        self._lock = threading.Lock()
+        self._next_reorder = time.monotonic() + reorder_interval
+
+    def _shard(self):
+        """
+        (hits per tag, other events) counters of the calling thread.
+        """
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = (Counter(), Counter())
+            owner = self._local.owner = _Owner()
+            with self._lock:
+                shard_id = next(self._shard_ids)
+                self._shards[shard_id] = shard
+            weakref.finalize(owner, self._retire, shard_id)
+        return shard
+
+    def _retire(self, shard_id):
+        """
+        Fold the counters of an ended thread into the retired totals.
+        """
+        with self._lock:
+            hits, events = self._shards.pop(shard_id)
+            self._retired[0].update(hits)
+            self._retired[1].update(events)
+
+    def record_hit(self, tag):
+        self._shard()[0][tag] += 1
+
+    def record_miss(self):
+        self._shard()[1]['misses'] += 1
+
+    def record_generation(self):
+        self._shard()[1]['generation_fallbacks'] += 1
+
+    def _totals(self):
+        with self._lock:
+            hits = Counter(self._retired[0])
+            events = Counter(self._retired[1])
+            shards = list(self._shards.values())
+        for shard_hits, shard_events in shards:
+            # dict.copy() runs without releasing the GIL, so it is safe
+            # while the owning thread keeps counting
+            hits.update(dict.copy(shard_hits))
+            events.update(dict.copy(shard_events))
+        return hits, events
+
+    def hit_counts(self):
+        """
+        Total hits per tag across all threads.
+        """
+        return self._totals()[0]
+
+    def reorder_due(self):
+        """
+        True at most once every reorder_interval seconds.
+        """
+        now = time.monotonic()
+        # Checked without the lock first; this runs on every lookup
+        if now < self._next_reorder:
+            return False
+        with self._lock:
+            if now < self._next_reorder:
+                return False
+            self._next_reorder = now + self.reorder_interval
+            return True
+
+    def snapshot(self, top=TOP_INTENTS):
+        """
+        Totals as a dict, with the top most hit intents.
+        """
+        hits, events = self._totals()
+        total_hits = sum(hits.values())
+        lookups = total_hits + events['misses']
+        return {
+            "since": self.started,
+            "lookups": lookups,
+            "hits": total_hits,
+            "misses": events['misses'],
+            "generation_fallbacks": events['generation_fallbacks'],
+            "hit_ratio": total_hits / lookups if lookups else 0.0,
+            "top_intents": [{"tag": tag, "hits": count} for tag, count in hits.most_common(top)]
+        }
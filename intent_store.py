@@ -0,0 +1,307 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from intent_index import IntentIndex, load_intent_document
+
+# File layout (little-endian, every section 4-byte aligned):
+#   header       MAGIC, the mtime (ns) of the source file and the string id
+#                of its path (NO_SOURCE if unknown), then the number of
+#                strings, intents, patterns and response references, then
+#                the byte offset of each section
+#   strings      uint32[num_strings + 1] offsets into the UTF-8 blob
+#   blob         every distinct tag, pattern and response, stored once
+#   tags         uint32[num_intents] string ids
+#   responses    uint32[num_intents + 1] offsets into response_ids
+#   response_ids uint32[num_responses] string ids
+#   patterns     uint32[num_patterns] string ids of the normalized,
+#                deduplicated patterns in first-match order
+#   owners       uint32[num_patterns] intent position of each pattern
+MAGIC = b'INTSTOR2'
+HEADER = struct.Struct('<8sqI4I7I')
+NO_SOURCE = 0xFFFFFFFF
+SECTIONS = ('strings', 'blob', 'tags', 'responses', 'response_ids', 'patterns', 'owners')
+
+DEFAULT_STORE_PATH = 'intents.bin'
+
+
+def build_store(intents, path, source_path=None):
+    """
+    Compile an intents document into the binary store format at path.
+
+    The file is written to a temporary name and renamed into place, so
+    processes that have the old store mapped keep a consistent view.
+
+    Args:
+        intents: Intents document, as loaded by load_intent_document()
+        path: Store file to write
+        source_path: File the document was loaded from; its path and mtime
+            are recorded so is_store_current() can tell when it changes
+    """
+    index = IntentIndex.from_document(intents)
+
+    string_ids = {}
+    blob = bytearray()
+    offsets = array('I', [0])
+
+    def intern(text):
+        string_id = string_ids.get(text)
+        if string_id is None:
+            string_id = string_ids[text] = len(offsets) - 1
+            blob.extend(text.encode('utf-8'))
+            offsets.append(len(blob))
+        return string_id
+
+    tags = array('I', (intern(tag) for tag in index.tags))
+    response_offsets = array('I', [0])
+    response_ids = array('I')
+    for responses in index.responses:
+        response_ids.extend(intern(response) for response in responses)
+        response_offsets.append(len(response_ids))
+    patterns = array('I', (intern(pattern) for pattern in index.patterns))
+    owners = array('I', index.pattern_intents)
+    source_id, source_mtime = NO_SOURCE, 0
+    if source_path is not None:
+        source_id = intern(_relative_source(source_path, path))
+        source_mtime = os.stat(source_path).st_mtime_ns
+
+    blob.extend(b'\0' * (-len(blob) % 4))
+    sections = [offsets, blob, tags, response_offsets, response_ids, patterns, owners]
+
+    section_offsets = []
+    position = HEADER.size
+    for section in sections:
+        section_offsets.append(position)
+        position += len(_to_bytes(section))
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, source_mtime, source_id, len(offsets) - 1, len(tags),
+                               len(patterns), len(response_ids), *section_offsets))
+        for section in sections:
+            file.write(_to_bytes(section))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+def _relative_source(source_path, store_path):
+    """
+    source_path relative to the store's directory, so the recorded source
+    survives moving both files together.
+    """
+    return os.path.relpath(source_path, os.path.dirname(os.path.abspath(store_path)))
+
+
+def _to_bytes(section):
+    """
+    Little-endian bytes of a uint32 array (or a bytearray as-is).
+    """
+    if isinstance(section, bytearray):
+        return bytes(section)
+    if sys.byteorder != 'little':
+        section = array('I', section)
+        section.byteswap()
+    return section.tobytes()
+
+
+class IntentStore:
+    """
+    Read-only, memory-mapped view of a compiled intent store.
+
+    Nothing is parsed when the store is opened: tags, patterns and responses
+    are decoded from the mapped pages on access, and every process that opens
+    the same file shares those pages through the page cache.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = HEADER.unpack_from(self._mmap, 0)
+        if header[0] != MAGIC:
+            raise ValueError(f"{path} is not an intent store")
+        source_mtime, source_id = header[1:3]
+        num_strings, num_intents, num_patterns, num_responses = header[3:7]
+        offsets = dict(zip(SECTIONS, header[7:]))
+
+        view = memoryview(self._mmap)
+        self._blob = view[offsets['blob']:offsets['tags']]
+        self._string_offsets = _uint32_view(view, offsets['strings'], num_strings + 1)
+        self._tag_ids = _uint32_view(view, offsets['tags'], num_intents)
+        self._response_offsets = _uint32_view(view, offsets['responses'], num_intents + 1)
+        self._response_ids = _uint32_view(view, offsets['response_ids'], num_responses)
+        self._pattern_ids = _uint32_view(view, offsets['patterns'], num_patterns)
+        self.pattern_intents = _uint32_view(view, offsets['owners'], num_patterns)
+
+        self.tags = _StringList(self, '_tag_ids', 'tags')
+        self.patterns = _StringList(self, '_pattern_ids', 'patterns')
+        self.responses = _ResponseTable(self)
+        # (path relative to the store, mtime in ns) of the file the store
+        # was built from, or None
+        self.source = None if source_id == NO_SOURCE else (self.string(source_id), source_mtime)
+
+    def __reduce__(self):
+        # Worker processes re-map the file instead of copying its contents
+        return (IntentStore, (self.path,))
+
+    def string(self, string_id):
+        """
+        Decode string string_id from the blob.
+        """
+        start = self._string_offsets[string_id]
+        end = self._string_offsets[string_id + 1]
+        return str(self._blob[start:end], 'utf-8')
+
+    def to_index(self):
+        """
+        Build an IntentIndex over the mapped tables.
+        """
+        return IntentIndex(self.tags, self.responses, self.patterns, self.pattern_intents)
+
+
+def _uint32_view(view, offset, count):
+    """
+    uint32 sequence over count values of view starting at offset.
+    """
+    section = view[offset:offset + count * 4]
+    if sys.byteorder == 'little':
+        return section.cast('I')
+    values = array('I', section)
+    values.byteswap()
+    return values
+
+
+class _StringList:
+    """
+    Sequence of strings decoded on access from a table of string ids.
+    """
+
+    def __init__(self, store, ids_attribute, name):
+        self._store = store
+        self._ids = getattr(store, ids_attribute)
+        self._name = name
+
+    def __reduce__(self):
+        return (getattr, (self._store, self._name))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, i):
+        return self._store.string(self._ids[i])
+
+    def __iter__(self):
+        string = self._store.string
+        return (string(string_id) for string_id in self._ids)
+
+
+class _ResponseTable:
+    """
+    Sequence of per-intent response tuples decoded on access.
+    """
+
+    def __init__(self, store):
+        self._store = store
+
+    def __reduce__(self):
+        return (getattr, (self._store, 'responses'))
+
+    def __len__(self):
+        return len(self._store._response_offsets) - 1
+
+    def __getitem__(self, position):
+        store = self._store
+        start = store._response_offsets[position]
+        end = store._response_offsets[position + 1]
+        return tuple(store.string(store._response_ids[i]) for i in range(start, end))
+
+    def __iter__(self):
+        return (self[position] for position in range(len(self)))
+
+
+def read_store_source(path=DEFAULT_STORE_PATH):
+    """
+    (source path relative to the store, source mtime in ns) recorded in the
+    store header, or None if the store has no source or is missing,
+    unreadable or of an older format. Reads the header only.
+    """
+    try:
+        with open(path, 'rb') as file:
+            header = HEADER.unpack(file.read(HEADER.size))
+            if header[0] != MAGIC or header[2] == NO_SOURCE:
+                return None
+            offsets = dict(zip(SECTIONS, header[7:]))
+            file.seek(offsets['strings'] + header[2] * 4)
+            start, end = struct.unpack('<2I', file.read(8))
+            file.seek(offsets['blob'] + start)
+            return file.read(end - start).decode('utf-8'), header[1]
+    except (OSError, struct.error, UnicodeDecodeError):
+        return None
+
+
+def is_store_current(store_path=DEFAULT_STORE_PATH, source_path='intents.json'):
+    """
+    True if store_path was built from source_path as it is now on disk: the
+    header records that path and its current mtime. A store built from
+    another file (e.g. intents.csv) is never current for intents.json. When
+    source_path does not exist, any readable store is used.
+    """
+    if not os.path.exists(source_path):
+        try:
+            IntentStore(store_path)
+            return True
+        except (OSError, ValueError, struct.error):
+            return False
+    try:
+        source_mtime = os.stat(source_path).st_mtime_ns
+    except OSError:
+        return False
+    return read_store_source(store_path) == (_relative_source(source_path, store_path), source_mtime)
+
+
+def open_intent_index(path=DEFAULT_STORE_PATH):
+    """
+    Open a compiled store and return an IntentIndex over it.
+    """
+    return IntentStore(path).to_index()
+
+
+def load_intent_index(source_path='intents.json', store_path=DEFAULT_STORE_PATH):
+    """
+    Load the intents in source_path as an IntentIndex, without the journal.
+    """
+    # The compiled store is memory-mapped instead of parsed, but it is only
+    # used when its header names source_path (relative to the store) and
+    # records the exact mtime source_path has now; a newer or older source,
+    # or a store built from another file, means the source is parsed
+    if is_store_current(store_path, source_path):
+        return open_intent_index(store_path)
+    return IntentIndex.from_document(load_intent_document(source_path))
+
+
+def main():
+    """
+    Compile intents.json or intents.csv into a memory-mappable intent store.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help="compile an intents file")
+    build.add_argument('--intents', default='intents.json',
+                       help="source intents (.json or .csv)")
+    build.add_argument('--output', default=DEFAULT_STORE_PATH)
+    args = parser.parse_args()
+
+    intents = load_intent_document(args.intents)
+    build_store(intents, args.output, source_path=args.intents)
+    store = IntentStore(args.output)
+    print(f"Wrote {args.output}: {len(store.tags)} tags, {len(store.patterns)} patterns, "
+          f"{os.path.getsize(args.output):,} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+# inotify event masks (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+
+EVENT_HEADER = struct.Struct('iIII')
+
+POLL_INTERVAL = 0.5  # seconds between checks when inotify is unavailable
+DEBOUNCE = 0.05  # seconds to wait for related events before reloading
+
+
+class _Inotify:
+    """
+    Minimal ctypes binding to Linux inotify, watching one directory.
+    """
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        # Watch the directory rather than the files: editors and our own
+        # compaction replace files by renaming over them
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+        if wd < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+
+    def read(self, timeout):
+        """
+        Names of files written or renamed into the directory, waiting up to
+        timeout seconds (None to block).
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        names = set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return names
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            names.add(os.fsdecode(data[offset:offset + length].rstrip(b'\0')))
+            offset += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class IntentsWatcher:
+    """
+    Calls on_change whenever one of the watched files is rewritten.
+
+    Uses inotify where available, so edits propagate in milliseconds without
+    any polling, and falls back to comparing mtime and size every
+    POLL_INTERVAL seconds elsewhere. on_change runs on the watcher thread,
+    which keeps rebuilding the intent index off the request path.
+    """
+
+    def __init__(self, paths, on_change, poll_interval=POLL_INTERVAL):
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self._stopped = threading.Event()
+
+    def start(self):
+        """
+        Run the watcher on a daemon thread and return the thread.
+        """
+        thread = threading.Thread(target=self.run, name="intents-watcher", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        """
+        Watch until stop() is called.
+        """
+        directories = {os.path.dirname(path) for path in self.paths}
+        if len(directories) == 1:
+            try:
+                inotify = _Inotify(directories.pop())
+            except (OSError, AttributeError) as e:
+                print(f"inotify unavailable ({e}); polling intents files instead.")
+            else:
+                try:
+                    self._run_inotify(inotify)
+                finally:
+                    inotify.close()
+                return
+        self._run_polling()
+
+    def _run_inotify(self, inotify):
+        names = {os.path.basename(path) for path in self.paths}
+        while not self._stopped.is_set():
+            # Wake up periodically so stop() is honoured
+            changed = inotify.read(1.0) & names
+            if not changed:
+                continue
+            # Coalesce the burst of events a single save tends to produce
+            time.sleep(DEBOUNCE)
+            changed |= inotify.read(0) & names
+            self._notify(changed)
+
+    def _run_polling(self):
+        signatures = {path: _signature(path) for path in self.paths}
+        while not self._stopped.wait(self.poll_interval):
+            changed = set()
+            for path in self.paths:
+                signature = _signature(path)
+                if signature != signatures[path]:
+                    signatures[path] = signature
+                    changed.add(os.path.basename(path))
+            if changed:
+                self._notify(changed)
+
+    def _notify(self, changed):
+        try:
+            self.on_change(changed)
+        except Exception as e:
+            print(f"Error reloading intents: {e}")
+
+
+def _signature(path):
+    """
+    (mtime, size) of path, or None if it does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
@@ -0,0 +1,135 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+from intent_index import normalize_utterance
+
+DEFAULT_MAXSIZE = 256
+
+
+class LearningQueue:
+    """
+    Bounded queue of unmatched utterances waiting to be taught a response.
+
+    The matcher only submits to it, which never blocks: repeated utterances
+    are folded into one item, and once the queue is full the oldest item is
+    dropped. Teaching happens elsewhere, when the CLI drains the queue
+    between turns or a reviewer answers items through the /learning
+    endpoints in app.py.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        """
+        Args:
+            maxsize: Maximum number of pending utterances
+        """
+        self.maxsize = maxsize
+        # Item id -> item, oldest first
+        self._items = OrderedDict()
+        # Normalized utterance -> item id
+        self._keys = {}
+        self._ids = itertools.count(1)
+        self._not_empty = threading.Condition()
+        self.submitted = 0
+        self.dropped = 0
+
+    def __len__(self):
+        with self._not_empty:
+            return len(self._items)
+
+    def submit(self, text, suggestion=None):
+        """
+        Queue an unmatched utterance and return its item id.
+
+        Args:
+            text: The utterance as heard or typed
+            suggestion: Optional candidate response, e.g. the generated reply
+        """
+        key = normalize_utterance(text)
+        now = time.time()
+        with self._not_empty:
+            self.submitted += 1
+            item_id = self._keys.get(key)
+            if item_id is not None:
+                item = self._items[item_id]
+                item['count'] += 1
+                item['last_seen'] = now
+                if suggestion:
+                    item['suggestion'] = suggestion
+                return item_id
+
+            if len(self._items) >= self.maxsize:
+                _, oldest = self._items.popitem(last=False)
+                del self._keys[oldest['key']]
+                self.dropped += 1
+
+            item_id = next(self._ids)
+            self._items[item_id] = {
+                "id": item_id,
+                "key": key,
+                "text": text,
+                "suggestion": suggestion,
+                "count": 1,
+                "first_seen": now,
+                "last_seen": now
+            }
+            self._keys[key] = item_id
+            self._not_empty.notify()
+            return item_id
+
+    def suggest(self, text, suggestion):
+        """
+        Attach a candidate response to the pending item for text, without
+        counting the utterance again. Returns the item id, or None if the
+        utterance is not queued (e.g. it was dropped or already taken).
+        """
+        key = normalize_utterance(text)
+        with self._not_empty:
+            item_id = self._keys.get(key)
+            if item_id is not None and suggestion:
+                self._items[item_id]['suggestion'] = suggestion
+            return item_id
+
+    def take(self, timeout=0):
+        """
+        Remove and return the oldest item, waiting up to timeout seconds
+        (None to wait indefinitely). Returns None if the queue stays empty.
+        """
+        with self._not_empty:
+            if not self._not_empty.wait_for(lambda: self._items, timeout):
+                return None
+            _, item = self._items.popitem(last=False)
+            del self._keys[item['key']]
+            return dict(item)
+
+    def remove(self, item_id):
+        """
+        Remove and return the item with item_id, or None if it is gone.
+        """
+        with self._not_empty:
+            item = self._items.pop(item_id, None)
+            if item is None:
+                return None
+            del self._keys[item['key']]
+            return dict(item)
+
+    def pending(self, limit=None):
+        """
+        Copies of the pending items, oldest first.
+        """
+        with self._not_empty:
+            items = itertools.islice(self._items.values(), limit)
+            return [dict(item) for item in items]
+
+    def stats(self):
+        """
+        Counters and current size as a dict.
+        """
+        with self._not_empty:
+            return {
+                "size": len(self._items),
+                "maxsize": self.maxsize,
+                "submitted": self.submitted,
+                "dropped": self.dropped
+            }
@@ -0,0 +1,99 @@
+import threading
+import time
+
+# Short prompts run once after loading, so the first real request does not
+# pay for lazy initialization inside the model and tokenizer
+WARMUP_PROMPTS = (
+    "Hello",
+    "How are you today?",
+    "Can you tell me something interesting?"
+)
+
+LOADING = 'loading'
+WARMING_UP = 'warming_up'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class ModelLoader:
+    """
+    Loads the chatbot model on a background thread.
+
+    The web app can serve requests (and intent matches) immediately, and
+    asks get() for the model on every request: it returns None until the
+    model is loaded and warmed up, and the loaded model from then on.
+    """
+
+    def __init__(self, load, warmup=None):
+        """
+        Args:
+            load: Callable returning the model, e.g. initialize_chatbot
+            warmup: Optional callable run once with the loaded model
+        """
+        self._load = load
+        self._warmup = warmup
+        self._ready = threading.Event()
+        self._model = None
+        self.state = LOADING
+        self.error = None
+        self.started_at = time.time()
+        self.load_seconds = None
+        self.warmup_seconds = None
+
+    def start(self):
+        """
+        Start loading on a daemon thread and return the thread.
+        """
+        thread = threading.Thread(target=self._run, name="model-loader", daemon=True)
+        thread.start()
+        return thread
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            model = self._load()
+        except (Exception, SystemExit) as e:
+            # initialize_chatbot() prints the error and calls sys.exit()
+            self.error = str(e) if isinstance(e, Exception) else "model initialization exited"
+            self.state = FAILED
+            print(f"Error loading model: {self.error}")
+            return
+        self.load_seconds = time.perf_counter() - start
+
+        if self._warmup is not None:
+            self.state = WARMING_UP
+            start = time.perf_counter()
+            try:
+                self._warmup(model)
+            except Exception as e:
+                # A failed warm-up only costs latency on the first requests
+                print(f"Error warming up model: {e}")
+            self.warmup_seconds = time.perf_counter() - start
+
+        self._model = model
+        self.state = READY
+        self._ready.set()
+
+    def ready(self):
+        return self._ready.is_set()
+
+    def get(self, timeout=0):
+        """
+        The loaded model, waiting up to timeout seconds (None to wait until
+        it is ready). Returns None if it is not ready by then.
+        """
+        if self._ready.wait(timeout):
+            return self._model
+        return None
+
+    def status(self):
+        """
+        Loading state and timings as a dict.
+        """
+        return {
+            "state": self.state,
+            "error": self.error,
+            "uptime": time.time() - self.started_at,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds
+        }
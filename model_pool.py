@@ -0,0 +1,451 @@
+import gc
+import itertools
+import multiprocessing
+import os
+import signal
+import threading
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing import reduction
+from multiprocessing.connection import Connection
+
+import torch
+from transformers import TextStreamer
+
+from generation_cache import GenerationCache, model_params
+from generation_scheduler import DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT, GenerationScheduler
+from session_cache import SessionCache, session_cache_bytes
+
+# Number of forked model workers; 0 (the default) generates in the app process
+WORKERS_VARIABLE = 'MODEL_WORKERS'
+
+
+def workers_from_environment():
+    """
+    Number of model workers set by MODEL_WORKERS, 0 by default.
+    """
+    return max(0, int(os.environ.get(WORKERS_VARIABLE, 0)))
+
+
+def _run_template(load, control, pool_control, worker_args):
+    """
+    Template process: load the model, report its tokenizer to the pool, then
+    fork a worker whenever the pool asks for one and hand the pool its end
+    of the worker's connection.
+
+    It is forked once, before the app process starts other threads, and
+    never runs the model, so every worker (first or replacement) starts
+    from the same clean copy of the loaded model.
+    """
+    # Only the app process may hold its end, so its exit reads as EOF here
+    pool_control.close()
+    try:
+        chatbot, tokenizer = load()
+    except (Exception, SystemExit) as e:
+        # initialize_chatbot() prints the error and calls sys.exit()
+        control.send(('error', str(e) if isinstance(e, Exception) else "model initialization exited"))
+        return
+    # Objects that exist before the fork are never collected in the
+    # workers, so the collector does not write to (and copy) their pages
+    gc.collect()
+    gc.freeze()
+    control.send(('ok', (tokenizer, model_params(chatbot.model))))
+
+    # Workers are reaped automatically
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    while True:
+        try:
+            worker = control.recv()
+        except EOFError:
+            return
+        pool_end, worker_end = multiprocessing.Pipe()
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            control.close()
+            pool_end.close()
+            try:
+                _run_worker(chatbot, worker_end, *worker_args)
+            finally:
+                os._exit(0)
+        worker_end.close()
+        reduction.send_handle(control, pool_end.fileno(), os.getppid())
+        control.send(pid)
+        pool_end.close()
+
+
+def _run_worker(chatbot, connection, max_batch_size, max_wait, threads):
+    """
+    Worker process: serve generation jobs with the model inherited from the
+    parent. Stateless prompts are micro-batched by a local scheduler, and
+    the sessions routed to this worker keep their cache here.
+    """
+    torch.set_num_threads(threads)
+    scheduler = GenerationScheduler.from_pipeline(chatbot, max_batch_size=max_batch_size, max_wait=max_wait)
+    # A fresh cache: its SQLite connection must not be shared with the parent
+    sessions = SessionCache.from_environment(chatbot, generation_cache=GenerationCache.from_environment())
+    session_executor = ThreadPoolExecutor(max_workers=max_batch_size, thread_name_prefix="session")
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            connection.send(message)
+
+    def reply(job_id, future):
+        try:
+            send((job_id, 'ok', future.result()))
+        except Exception as e:
+            send((job_id, 'error', str(e)))
+
+    def streamer(job_id):
+        return ConnectionStreamer(chatbot.tokenizer, lambda text: send((job_id, 'token', text)))
+
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:
+            # The app process is gone
+            return
+        if job is None:
+            return
+        job_id, kind, args = job
+        if kind == 'generate':
+            future = scheduler.submit(*args)
+        elif kind == 'stream':
+            future = session_executor.submit(_stream, chatbot, streamer(job_id), *args)
+        elif kind == 'session' and sessions is not None:
+            future = session_executor.submit(sessions.generate, *args)
+        elif kind == 'session_stream' and sessions is not None:
+            future = session_executor.submit(sessions.generate, *args, streamer=streamer(job_id))
+        else:
+            send((job_id, 'error', f"Unsupported job: {kind}"))
+            continue
+        future.add_done_callback(lambda future, job_id=job_id: reply(job_id, future))
+
+
+def _stream(chatbot, streamer, prompt, max_new_tokens):
+    """
+    Generate a reply to prompt token ids on its own, passing the text to
+    streamer as it is produced.
+    """
+    input_ids = torch.tensor([prompt])
+    with torch.no_grad():
+        outputs = chatbot.model.generate(
+            input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            max_new_tokens=max_new_tokens,
+            pad_token_id=chatbot.tokenizer.eos_token_id,
+            streamer=streamer
+        )
+    return chatbot.tokenizer.decode(outputs[0, len(prompt):], skip_special_tokens=True).strip()
+
+
+class ConnectionStreamer(TextStreamer):
+    """
+    Streamer passing each finalized piece of a reply's text to send, e.g.
+    to ship it from a worker to the app process.
+    """
+
+    def __init__(self, tokenizer, send):
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        self.send = send
+
+    def on_finalized_text(self, text, stream_end=False):
+        if text:
+            self.send(text)
+
+
+class ModelPool:
+    """
+    Generation on a pool of forked worker processes sharing one copy of the
+    model weights.
+
+    A template process is forked when the pool is created, which must be
+    before the app starts other threads. The template loads the model, and
+    start() waits for it and has it fork the workers: their weights are the
+    template's pages, shared copy-on-write, and inference never writes to
+    them, so memory stays about one model however many workers run. The app
+    process only gets the tokenizer, so creating the pool costs a fork and
+    the app can serve while the model loads. The template never runs the
+    model, so replacing a dead worker forks a clean process too, never the
+    busy app process. Each worker gets a share of the CPU cores for its
+    PyTorch threads.
+
+    Every worker has a connection of its own to the app process, which
+    carries its jobs one way and its replies and streamed text the other, so
+    a worker killed mid-write (e.g. by the OOM killer) only breaks its own
+    connection. The app notices the closed connection, fails that worker's
+    jobs and forks a replacement.
+
+    The pool has the same generate()/submit() interface as the
+    GenerationScheduler: stateless prompts go to the worker with the fewest
+    jobs in flight, where they are micro-batched. Session turns always go to
+    the same worker, which keeps that session's cached keys and values.
+    """
+
+    def __init__(self, load, workers, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT):
+        """
+        Args:
+            load: Callable returning (text-generation pipeline, tokenizer),
+                e.g. initialize_chatbot; it runs in the template process
+            workers: Number of worker processes
+            max_batch_size: Most prompts a worker batches into one generate() call
+            max_wait: Seconds a worker waits for more prompts before running a batch
+        """
+        self.num_workers = workers
+        self._connections = [None] * workers
+        self._send_locks = [threading.Lock() for _ in range(workers)]
+        self._pids = [None] * workers
+        self._pending = {}  # job id -> (future, worker, text callback)
+        self._in_flight = [0] * workers
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._spawn_lock = threading.Lock()
+        self._closed = False
+        self.requests = 0
+        self.errors = 0
+        self.restarts = 0
+        self.tokenizer = None
+        self.model_params = None
+
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        self._control, template_control = multiprocessing.Pipe()
+        self._template = multiprocessing.get_context('fork').Process(
+            target=_run_template,
+            args=(load, template_control, self._control, (max_batch_size, max_wait, threads)),
+            name="model-template",
+            daemon=True
+        )
+        self._template.start()
+        template_control.close()
+
+    @classmethod
+    def from_environment(cls, load):
+        """
+        Pool of MODEL_WORKERS processes (batched like GENERATION_MAX_BATCH
+        and GENERATION_MAX_WAIT_MS), or None when MODEL_WORKERS is 0 or unset.
+        """
+        workers = workers_from_environment()
+        if workers <= 0:
+            return None
+        return cls(
+            load,
+            workers,
+            max_batch_size=int(os.environ.get('GENERATION_MAX_BATCH', DEFAULT_MAX_BATCH_SIZE)),
+            max_wait=float(os.environ.get('GENERATION_MAX_WAIT_MS', DEFAULT_MAX_WAIT * 1000)) / 1000
+        )
+
+    def start(self):
+        """
+        Wait for the template to load the model and fork every worker.
+        Raises RuntimeError if loading failed.
+        """
+        try:
+            status, value = self._control.recv()
+        except EOFError:
+            raise RuntimeError("Model template process exited")
+        if status != 'ok':
+            raise RuntimeError(f"Model template failed: {value}")
+        self.tokenizer, self.model_params = value
+        for worker in range(self.num_workers):
+            self._start_worker(worker)
+
+    def _start_worker(self, worker):
+        """
+        Have the template fork a worker and start reading its replies.
+        """
+        with self._spawn_lock:
+            self._control.send(worker)
+            connection = Connection(reduction.recv_handle(self._control))
+            pid = self._control.recv()
+        with self._lock:
+            self._connections[worker] = connection
+            self._pids[worker] = pid
+        threading.Thread(target=self._read_replies, args=(worker, connection),
+                         name=f"model-pool-results-{worker}", daemon=True).start()
+
+    def _dispatch(self, worker, kind, *args, on_text=None):
+        future = Future()
+        with self._lock:
+            connection = self._connections[worker]
+            if connection is None:
+                self.errors += 1
+                future.set_exception(RuntimeError(f"Model worker {worker} is restarting"))
+                return future
+            job_id = next(self._ids)
+            self._pending[job_id] = (future, worker, on_text)
+            self._in_flight[worker] += 1
+            self.requests += 1
+        try:
+            with self._send_locks[worker]:
+                connection.send((job_id, kind, args))
+        except (OSError, ValueError):
+            # The worker died; its reader fails the job unless it already has
+            self._fail(job_id, RuntimeError(f"Model worker {worker} exited"))
+        return future
+
+    def submit(self, prompt):
+        """
+        Queue a prompt (text or token ids) on the least busy worker and
+        return a Future resolving to the generated reply.
+        """
+        with self._lock:
+            live = [worker for worker in range(self.num_workers) if self._connections[worker] is not None]
+            worker = min(live or range(self.num_workers), key=self._in_flight.__getitem__)
+        return self._dispatch(worker, 'generate', prompt)
+
+    def generate(self, prompt, timeout=None):
+        """
+        Generate a reply to prompt on a worker, blocking until it is done.
+        """
+        return self.submit(prompt).result(timeout)
+
+    def stream(self, prompt, max_new_tokens, streamer, timeout=None):
+        """
+        Generate a reply to prompt token ids on the least busy worker, on its
+        own rather than batched, passing its text to a transformers streamer
+        (e.g. TextIteratorStreamer) as the worker produces it.
+        """
+        with self._lock:
+            live = [worker for worker in range(self.num_workers) if self._connections[worker] is not None]
+            worker = min(live or range(self.num_workers), key=self._in_flight.__getitem__)
+        future = self._dispatch(worker, 'stream', prompt, max_new_tokens, on_text=streamer.on_finalized_text)
+        try:
+            return future.result(timeout)
+        finally:
+            streamer.on_finalized_text("", stream_end=True)
+
+    def generate_session(self, session_id, text, streamer=None, timeout=None):
+        """
+        Generate the reply to text in the conversation session_id, on the
+        worker that holds the session, passing its text to an optional
+        streamer as it is produced.
+        """
+        worker = zlib.crc32(str(session_id).encode('utf-8')) % self.num_workers
+        if streamer is None:
+            return self._dispatch(worker, 'session', session_id, text).result(timeout)
+        future = self._dispatch(worker, 'session_stream', session_id, text, on_text=streamer.on_finalized_text)
+        try:
+            return future.result(timeout)
+        finally:
+            streamer.on_finalized_text("", stream_end=True)
+
+    @property
+    def sessions(self):
+        """
+        SessionCache-like view that generates session turns on the pool, or
+        None when SESSION_CACHE_MB turns session caching off.
+        """
+        return PoolSessions(self) if session_cache_bytes() > 0 else None
+
+    def _read_replies(self, worker, connection):
+        while True:
+            try:
+                job_id, status, value = connection.recv()
+            except (EOFError, OSError):
+                break
+            if status == 'token':
+                with self._lock:
+                    entry = self._pending.get(job_id)
+                if entry is not None and entry[2] is not None:
+                    entry[2](value)
+                continue
+            with self._lock:
+                future, _, _ = self._pending.pop(job_id, (None, None, None))
+                if future is None:
+                    continue
+                self._in_flight[worker] -= 1
+                if status != 'ok':
+                    self.errors += 1
+            if status == 'ok':
+                future.set_result(value)
+            else:
+                future.set_exception(RuntimeError(f"Model worker error: {value}"))
+        self._worker_exited(worker, connection)
+
+    def _fail(self, job_id, error):
+        with self._lock:
+            future, worker, _ = self._pending.pop(job_id, (None, None, None))
+            if future is None:
+                return
+            self._in_flight[worker] -= 1
+            self.errors += 1
+        future.set_exception(error)
+
+    def _worker_exited(self, worker, connection):
+        """
+        Fail the jobs of a worker whose connection closed and fork a
+        replacement.
+        """
+        with self._lock:
+            if self._connections[worker] is not connection:
+                return
+            self._connections[worker] = None
+            lost = [job_id for job_id, (_, owner, _) in self._pending.items() if owner == worker]
+            failed = [self._pending.pop(job_id)[0] for job_id in lost]
+            self._in_flight[worker] = 0
+            self.errors += len(failed)
+            closed = self._closed
+        connection.close()
+        for future in failed:
+            future.set_exception(RuntimeError(f"Model worker {worker} exited"))
+        if closed:
+            return
+        try:
+            self._start_worker(worker)
+        except (EOFError, OSError) as e:
+            print(f"Error restarting model worker {worker}: {e}")
+            return
+        with self._lock:
+            self.restarts += 1
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            connections = list(self._connections)
+        for worker, connection in enumerate(connections):
+            if connection is None:
+                continue
+            try:
+                with self._send_locks[worker]:
+                    connection.send(None)
+            except (OSError, ValueError):
+                pass
+        self._control.close()
+        self._template.join(timeout=5)
+        if self._template.is_alive():
+            self._template.terminate()
+
+    def stats(self):
+        """
+        Pool counters as a dict.
+        """
+        with self._lock:
+            return {
+                "workers": self.num_workers,
+                "alive": sum(connection is not None for connection in self._connections),
+                "pids": list(self._pids),
+                "in_flight": list(self._in_flight),
+                "requests": self.requests,
+                "errors": self.errors,
+                "restarts": self.restarts
+            }
+
+
+class PoolSessions:
+    """
+    Stand-in for a SessionCache whose sessions live in the pool's workers.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def generate(self, session_id, text, streamer=None):
+        """
+        Reply to text in session_id. A streamer gets the text as the worker
+        produces it.
+        """
+        return self.pool.generate_session(session_id, text, streamer=streamer)
+
+    def stats(self):
+        return self.pool.stats()
@@ -0,0 +1,124 @@
+import argparse
+import os
+import time
+
+# Set GENERATION_BACKEND=onnx to generate with ONNX Runtime instead of
+# PyTorch, from the model exported to ONNX_MODEL_PATH
+BACKEND_VARIABLE = 'GENERATION_BACKEND'
+MODEL_PATH_VARIABLE = 'ONNX_MODEL_PATH'
+DEFAULT_MODEL = 'microsoft/DialoGPT-medium'
+DEFAULT_OUTPUT = 'onnx_model'
+BACKENDS = ('torch', 'onnx')
+
+
+def _ort_model_class():
+    try:
+        from optimum.onnxruntime import ORTModelForCausalLM
+    except ImportError:
+        raise ImportError("The ONNX backend needs optimum and onnxruntime: "
+                          "pip install optimum[onnxruntime]") from None
+    return ORTModelForCausalLM
+
+
+def export_model(model_path=DEFAULT_MODEL, output_dir=DEFAULT_OUTPUT):
+    """
+    Export a causal language model and its tokenizer to ONNX.
+
+    The graph takes the past keys and values as inputs and returns the new
+    ones, so generation runs each step over the newest token only, as the
+    PyTorch model does with use_cache.
+
+    Args:
+        model_path: Hugging Face model name or a local checkpoint, e.g.
+            training.py's results/final_model
+        output_dir: Directory for model.onnx, its config and the tokenizer
+    """
+    from transformers import AutoTokenizer
+
+    model = _ort_model_class().from_pretrained(model_path, export=True, use_cache=True)
+    model.save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(model_path).save_pretrained(output_dir)
+    return output_dir
+
+
+def load_onnx_model(path=DEFAULT_OUTPUT):
+    """
+    Load a model exported with export_model() on ONNX Runtime's CPU provider.
+
+    ONNX Runtime applies its graph optimizations (operator fusion,
+    constant folding) when it creates the session.
+    """
+    return _ort_model_class().from_pretrained(path, use_cache=True, provider='CPUExecutionProvider')
+
+
+def backend_from_environment():
+    """
+    The generation backend set by GENERATION_BACKEND, 'torch' by default.
+    """
+    backend = os.environ.get(BACKEND_VARIABLE, 'torch').strip().lower() or 'torch'
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown {BACKEND_VARIABLE}: {backend} (expected one of {', '.join(BACKENDS)})")
+    return backend
+
+
+def onnx_model_path():
+    return os.environ.get(MODEL_PATH_VARIABLE, DEFAULT_OUTPUT)
+
+
+def compare(model_path, onnx_path, max_new_tokens, repeat):
+    """
+    A/B the PyTorch and ONNX Runtime backends on the same fixed prompts.
+    """
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    from benchmark_quantization import PROMPTS, agreement, generate
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    backends = (
+        ('torch', AutoModelForCausalLM.from_pretrained(model_path).eval()),
+        ('onnx', load_onnx_model(onnx_path))
+    )
+
+    results = {}
+    for name, model in backends:
+        generate(model, tokenizer, PROMPTS[:1], max_new_tokens)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            replies, _, token_latency = generate(model, tokenizer, PROMPTS, max_new_tokens)
+        elapsed = (time.perf_counter() - start) / repeat
+        results[name] = (replies, elapsed, token_latency)
+
+    reference = results['torch'][0]
+    print(f"{'backend':<8}{'replies/s':>11}{'ms/token':>10}{'identical':>11}{'prefix':>8}")
+    for name, (replies, elapsed, token_latency) in results.items():
+        identical, prefix = agreement(reference, replies)
+        print(f"{name:<8}{len(PROMPTS) / elapsed:>11.2f}{token_latency * 1000:>10.2f}"
+              f"{identical:>11.0%}{prefix:>8.0%}")
+
+
+def main():
+    """
+    Export the chatbot model to ONNX, or A/B it against PyTorch.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--model', default=DEFAULT_MODEL,
+                        help="model name or checkpoint, e.g. results/final_model")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="directory of the ONNX model")
+    parser.add_argument('--compare', action='store_true',
+                        help="compare the exported model with PyTorch instead of exporting")
+    parser.add_argument('--max-new-tokens', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.model, args.output, args.max_new_tokens, args.repeat)
+        return
+
+    start = time.perf_counter()
+    export_model(args.model, args.output)
+    print(f"Exported {args.model} to {args.output} in {time.perf_counter() - start:.1f}s")
+    print(f"Serve it with {BACKEND_VARIABLE}=onnx {MODEL_PATH_VARIABLE}={args.output}")
+
+
+if __name__ == "__main__":
+    main()
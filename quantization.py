@@ -0,0 +1,70 @@
+import io
+import os
+
+import torch
+from torch import nn
+from transformers.pytorch_utils import Conv1D
+
+# Set MODEL_QUANTIZATION=int8 to serve the quantized model from initialize_chatbot()
+QUANTIZATION_VARIABLE = 'MODEL_QUANTIZATION'
+QUANTIZATION_MODES = ('int8',)
+
+
+def conv1d_to_linear(model):
+    """
+    Replace the GPT-2 Conv1D layers of model with equivalent nn.Linear ones,
+    in place.
+
+    Conv1D is a linear layer with a transposed weight, but quantize_dynamic()
+    only knows nn.Linear, so without this GPT-2 and DialoGPT would keep
+    every attention and MLP projection in fp32.
+    """
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if not isinstance(child, Conv1D):
+                continue
+            in_features, out_features = child.weight.shape
+            linear = nn.Linear(in_features, out_features, bias=child.bias is not None)
+            with torch.no_grad():
+                linear.weight.copy_(child.weight.t())
+                if child.bias is not None:
+                    linear.bias.copy_(child.bias)
+            setattr(parent, name, linear)
+    return model
+
+
+def quantize_model(model, mode='int8'):
+    """
+    Dynamically quantize the linear layers of a causal language model for
+    CPU inference, in place, and return it.
+
+    Weights are stored as int8 and activations are quantized on the fly, so
+    the projections run as int8 matmuls. The output projection stays in
+    fp32: it shares its weight with the token embeddings, so quantizing it
+    would add a copy instead of saving memory, and it decides every token.
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode: {mode} (expected one of {', '.join(QUANTIZATION_MODES)})")
+
+    model = conv1d_to_linear(model.eval())
+    output = model.get_output_embeddings()
+    layers = {name for name, module in model.named_modules()
+              if isinstance(module, nn.Linear) and module is not output}
+    return torch.ao.quantization.quantize_dynamic(model, layers, dtype=torch.qint8, inplace=True)
+
+
+def quantization_from_environment():
+    """
+    The quantization mode set by MODEL_QUANTIZATION, or None for fp32.
+    """
+    mode = os.environ.get(QUANTIZATION_VARIABLE, '').strip().lower()
+    return mode if mode and mode not in ('0', 'none', 'fp32') else None
+
+
+def model_size(model):
+    """
+    Bytes of the model's serialized state dict, quantized weights included.
+    """
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
@@ -0,0 +1,293 @@
+import os
+import threading
+from collections import OrderedDict
+
+import torch
+
+from generation_cache import generation_key, model_params
+
+DEFAULT_MAX_BYTES = 512 * 2 ** 20  # key/value tensors kept across all sessions
+DEFAULT_MAX_CONTEXT = 512  # tokens of history kept per session
+DEFAULT_MAX_NEW_TOKENS = 100
+
+
+def cache_nbytes(past_key_values):
+    """
+    Bytes held by the key/value tensors of a model's past_key_values.
+    """
+    if past_key_values is None:
+        return 0
+    if hasattr(past_key_values, 'layers'):
+        # Cache objects of recent transformers versions
+        layers = [(layer.keys, layer.values) for layer in past_key_values.layers]
+    elif hasattr(past_key_values, 'to_legacy_cache'):
+        layers = past_key_values.to_legacy_cache()
+    else:
+        layers = past_key_values
+    return sum(tensor.numel() * tensor.element_size()
+               for layer in layers for tensor in layer if tensor is not None)
+
+
+def session_cache_bytes():
+    """
+    Session cache budget set by SESSION_CACHE_MB. It is off (0) unless set:
+    session turns are generated one at a time, outside the scheduler's
+    batches, which costs throughput under concurrent load.
+    """
+    return int(float(os.environ.get('SESSION_CACHE_MB', 0)) * 2 ** 20)
+
+
+class Session:
+    """
+    One conversation: its turns as token ids, and the attention keys and
+    values of every token the model has already processed.
+    """
+
+    __slots__ = ('turns', 'past_key_values', 'length', 'pending', 'nbytes', 'lock')
+
+    def __init__(self):
+        self.turns = []  # token ids of every turn, each ending in EOS
+        self.past_key_values = None
+        self.length = 0  # tokens covered by past_key_values
+        self.pending = []  # tokens of the history not yet run through the model
+        self.nbytes = 0
+        self.lock = threading.Lock()
+
+    def reset(self):
+        self.past_key_values = None
+        self.length = 0
+        self.pending = [token for turn in self.turns for token in turn]
+        self.nbytes = 0
+
+
+class SessionCache:
+    """
+    Per-session reuse of past_key_values across conversation turns.
+
+    The history of a session is kept in DialoGPT's format, every turn
+    followed by EOS, together with the keys and values the model computed
+    for it. A new turn then runs the forward pass over its own tokens only,
+    instead of re-encoding the whole context, so time to first token stays
+    flat as the conversation grows. When the history outgrows max_context,
+    it is cut back to the most recent turns that fit in half of it and
+    encoded once more. Least recently used sessions are dropped whenever
+    the cached tensors exceed max_bytes.
+
+    Replies are decoded greedily, like the chatbot pipeline does by
+    default. Each session is generated on its own, so these requests are
+    not micro-batched by the GenerationScheduler. With a GenerationCache,
+    a reply already generated for the same history is reused: the turn and
+    reply then go through the model in a single forward pass instead of
+    one pass per reply token.
+    """
+
+    def __init__(self, model, tokenizer, max_bytes=DEFAULT_MAX_BYTES,
+                 max_context=DEFAULT_MAX_CONTEXT, max_new_tokens=DEFAULT_MAX_NEW_TOKENS,
+                 generation_cache=None):
+        """
+        Args:
+            model: Causal language model, e.g. the model of the chatbot pipeline
+            tokenizer: Its tokenizer
+            max_bytes: Most bytes of key/value tensors kept across sessions
+            max_context: Most history tokens kept per session, reply included
+            max_new_tokens: Longest reply, in tokens
+            generation_cache: Optional GenerationCache of reply token ids
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_bytes = max_bytes
+        self.max_context = min(max_context, getattr(model.config, 'n_positions', max_context))
+        self.max_new_tokens = max_new_tokens
+        self.eos_token_id = tokenizer.eos_token_id
+        self.generation_cache = generation_cache
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prefill_tokens = 0
+        self.reused_tokens = 0
+
+    @classmethod
+    def from_pipeline(cls, chatbot, **kwargs):
+        """
+        Session cache over the model and tokenizer of a text-generation pipeline.
+        """
+        return cls(chatbot.model, chatbot.tokenizer, **kwargs)
+
+    @classmethod
+    def from_environment(cls, chatbot, generation_cache=None):
+        """
+        from_pipeline() sized by SESSION_CACHE_MB, or None when it is 0 or unset.
+        """
+        max_bytes = session_cache_bytes()
+        if max_bytes <= 0:
+            return None
+        return cls.from_pipeline(chatbot, max_bytes=max_bytes, generation_cache=generation_cache)
+
+    def _session(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                self.misses += 1
+                session = self._sessions[session_id] = Session()
+            else:
+                self.hits += 1
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def generate(self, session_id, text, streamer=None):
+        """
+        Generate the reply to text in the conversation session_id, and
+        append both to its history. A transformers streamer gets the tokens
+        as they are produced, as with model.generate(streamer=...).
+        """
+        session = self._session(session_id)
+        with session.lock:
+            # An over-long turn keeps its end, like the scheduler's left truncation
+            turn = (self.tokenizer.encode(text) + [self.eos_token_id])[-(self.max_context // 2):]
+            if session.length + len(session.pending) + len(turn) + self.max_new_tokens > self.max_context:
+                self._truncate(session, len(turn))
+
+            key = cached = None
+            if self.generation_cache is not None:
+                context = [token for previous in session.turns for token in previous] + turn
+                key = generation_key(context, max_new_tokens=self.max_new_tokens, session=True,
+                                     **model_params(self.model))
+                cached = self.generation_cache.get(key)
+
+            try:
+                if cached is not None:
+                    reply = self._replay(session, session.pending + turn, cached, streamer)
+                else:
+                    reply = self._decode(session, session.pending + turn, streamer)
+            except Exception:
+                # The cached tensors may be half-updated; rebuild them next turn
+                session.turns.append(turn)
+                session.reset()
+                raise
+            session.turns.append(turn)
+            session.turns.append(reply + [self.eos_token_id])
+            session.nbytes = cache_nbytes(session.past_key_values)
+            if key is not None and cached is None:
+                self.generation_cache.put(key, reply)
+
+        self._evict()
+        return self.tokenizer.decode(reply, skip_special_tokens=True).strip()
+
+    def _truncate(self, session, turn_length):
+        """
+        Keep the most recent turns that fit in half of max_context with the
+        new turn and its reply, and drop the cached tensors.
+        """
+        budget = self.max_context // 2 - turn_length - self.max_new_tokens
+        kept = []
+        for turn in reversed(session.turns):
+            budget -= len(turn)
+            if budget < 0:
+                break
+            kept.append(turn)
+        session.turns = kept[::-1]
+        session.reset()
+
+    def _decode(self, session, tokens, streamer=None):
+        """
+        Run tokens through the model on top of the session's cached keys and
+        values, then decode greedily. Returns the reply token ids.
+        """
+        with self._lock:
+            self.prefill_tokens += len(tokens)
+            self.reused_tokens += session.length
+
+        past_key_values = session.past_key_values
+        input_ids = torch.tensor([tokens])
+        if streamer is not None:
+            streamer.put(input_ids)
+        reply = []
+        with torch.no_grad():
+            for _ in range(self.max_new_tokens):
+                # ONNX Runtime models need the mask over cached and new tokens
+                attention_mask = torch.ones(1, session.length + input_ids.shape[1], dtype=torch.long)
+                outputs = self.model(input_ids=input_ids, attention_mask=attention_mask,
+                                     past_key_values=past_key_values, use_cache=True)
+                past_key_values = outputs.past_key_values
+                session.length += input_ids.shape[1]
+                token = int(outputs.logits[0, -1].argmax())
+                if token == self.eos_token_id:
+                    break
+                reply.append(token)
+                input_ids = torch.tensor([[token]])
+                if streamer is not None:
+                    streamer.put(input_ids[0])
+        if streamer is not None:
+            streamer.end()
+
+        session.past_key_values = past_key_values
+        # The EOS closing the reply (and the last reply token, if it was cut
+        # off) go through the model at the start of the next turn
+        session.pending = [self.eos_token_id]
+        if len(reply) == self.max_new_tokens:
+            session.pending.insert(0, reply[-1])
+        return reply
+
+    def _replay(self, session, tokens, reply, streamer=None):
+        """
+        Run tokens and a cached reply through the model in one forward pass,
+        leaving the session as if the reply had just been decoded.
+        """
+        with self._lock:
+            self.prefill_tokens += len(tokens) + len(reply)
+            self.reused_tokens += session.length
+        if streamer is not None:
+            streamer.put(torch.tensor([tokens]))
+            if reply:
+                streamer.put(torch.tensor(reply))
+            streamer.end()
+
+        # Like _decode(), a reply cut off at max_new_tokens leaves its last
+        # token for the next turn
+        complete = len(reply) < self.max_new_tokens
+        fed = tokens + (reply if complete else reply[:-1])
+        with torch.no_grad():
+            outputs = self.model(input_ids=torch.tensor([fed]),
+                                 attention_mask=torch.ones(1, session.length + len(fed), dtype=torch.long),
+                                 past_key_values=session.past_key_values, use_cache=True)
+        session.past_key_values = outputs.past_key_values
+        session.length += len(fed)
+        session.pending = [self.eos_token_id] if complete else [reply[-1], self.eos_token_id]
+        return reply
+
+    def _evict(self):
+        """
+        Drop least recently used sessions until the cache fits in max_bytes.
+        """
+        with self._lock:
+            total = sum(session.nbytes for session in self._sessions.values())
+            while total > self.max_bytes and len(self._sessions) > 1:
+                _, session = self._sessions.popitem(last=False)
+                total -= session.nbytes
+                self.evictions += 1
+
+    def drop(self, session_id):
+        """
+        Forget a session, e.g. when its conversation ends.
+        """
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self):
+        """
+        Session counters as a dict.
+        """
+        with self._lock:
+            processed = self.prefill_tokens + self.reused_tokens
+            return {
+                "sessions": len(self._sessions),
+                "bytes": sum(session.nbytes for session in self._sessions.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "reused_token_share": self.reused_tokens / processed if processed else 0.0
+            }